@@ -1,17 +1,71 @@
-from flask import Flask, request
+from flask import Flask, Response, g, request
 from flask_cors import CORS
 import numpy as np
 import json
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime
 
 from price import (
     get_historical_price_yahoo
 )
 
+from price_store import (
+    PriceStore
+)
+
+from cache import (
+    LRUCache
+)
+
+import metrics
+
+from serving import (
+    DeadlineExceeded,
+    OptimizationPool,
+    PoolBusy
+)
+
+from encoding import (
+    to_base64_arrays,
+    to_binary,
+    to_json_lists
+)
+
+from config import (
+    ANCHOR_CACHE_SIZE,
+    COVARIANCE_CACHE_SIZE,
+    FRONTIER_CACHE_SIZE,
+    FRONTIER_MAX_POINTS,
+    FRONTIER_POINTS,
+    METRICS_TIMING_HEADER,
+    PORTFOLIO_BATCH_MAX_REQUESTS,
+    RESULT_CACHE_SIZE,
+    SERVING_MODE,
+    VALID_YEARS
+)
+
+from functions.window_statistics import (
+    compute_rolling_window_statistics,
+    compute_window_statistics,
+    get_window_start_date,
+    select_tickers
+)
+
 from functions.efficient_frontier import (
     display_efficient_frontier
 )
 
+from functions.covariance import (
+    estimate_covariance,
+    get_covariance_estimator
+)
+
+from functions.critical_line import (
+    critical_line_algorithm,
+    frontier_weights
+)
+
 from functions.return_function import (
     mean_returns_function,
     black_litterman_returns_function
@@ -22,11 +76,10 @@ from functions.test_performance import (
 )
 
 from functions.portfolio import (
-    find_maximum_return_point,
-    find_minimum_standard_deviation_point,
-    find_maximum_sharpe_ratio_point,
     find_efficient_return,
+    find_hierarchical_risk_parity_point,
     find_portfolio_with_risk_aversion,
+    find_anchor_points,
     portfolio_return,
     portfolio_standard_deviation,
     portfolio_sharpe_ratio
@@ -54,7 +107,7 @@ def get_tickers_without_ndx():
     tickers = tickers[:-1]
     return tickers
 
-def get_dataframe():
+def load_dataframe():
     tickers = get_tickers()
     start_date = '2010-1-1'
 
@@ -71,9 +124,149 @@ def get_dataframe():
 
     return df, nasdaq100_df
 
-def print_result(weights, daily_returns, cov_matrix, risk_free_rate):
-    port_return = portfolio_return(weights, daily_returns.mean(), cov_matrix)
-    port_std = portfolio_standard_deviation(weights, daily_returns.mean(), cov_matrix)
+def load_price_data():
+    with metrics.timed('download'):
+        df, nasdaq100_df = load_dataframe()
+    return build_price_data(df, nasdaq100_df)
+
+def build_price_data(df, nasdaq100_df):
+    """
+    - price store data from cleaned close prices, one column per ticker
+      and a '^NDX' column
+    """
+    now = datetime.now()
+    with metrics.timed('window_statistics'):
+        statistics = compute_rolling_window_statistics(df, VALID_YEARS, now)
+        nasdaq100_statistics = compute_rolling_window_statistics(
+            nasdaq100_df, VALID_YEARS, now)
+    return {
+        'stock': df,
+        'nasdaq100': nasdaq100_df,
+        'statistics': statistics,
+        'nasdaq100_statistics': nasdaq100_statistics
+    }
+
+price_store = PriceStore(load_price_data)
+result_cache = LRUCache(maxsize=RESULT_CACHE_SIZE)
+anchor_cache = LRUCache(maxsize=ANCHOR_CACHE_SIZE)
+frontier_cache = LRUCache(maxsize=FRONTIER_CACHE_SIZE)
+covariance_cache = LRUCache(maxsize=COVARIANCE_CACHE_SIZE)
+
+optimization_pool = None
+optimization_pool_version = None
+optimization_pool_lock = threading.Lock()
+
+def init_optimization_worker(snapshot):
+    price_store.set(snapshot)
+
+def get_optimization_pool():
+    """
+    - created on first use, i.e. in the process that serves requests
+      rather than in a parent that forks it later
+    - the price data is loaded here once and handed to every worker when
+      it starts, instead of each worker downloading it; the pool is
+      replaced when the snapshot is refreshed or a worker died
+    """
+    global optimization_pool, optimization_pool_version
+    snapshot = price_store.get()
+    with optimization_pool_lock:
+        if (optimization_pool is None or optimization_pool.broken \
+            or optimization_pool_version != snapshot.version):
+            if (optimization_pool is not None):
+                # jobs already running on the old pool still finish
+                optimization_pool.shutdown(wait=False)
+            optimization_pool = OptimizationPool(
+                initializer=init_optimization_worker, initargs=(snapshot,))
+            optimization_pool_version = snapshot.version
+        return optimization_pool
+
+def run_optimization(function, *args):
+    """
+    - function(*args) in the request thread, or on the worker pool when
+      SERVING_MODE = 'pool'; the caches live in the request process, so
+      callers look them up first and only send the misses here
+    - may raise PoolBusy or DeadlineExceeded in 'pool' mode
+    """
+    if (SERVING_MODE != 'pool'):
+        return function(*args)
+    # timings made in the worker are recorded here, where /metrics runs
+    result, observations = get_optimization_pool().run(
+        metrics.collect, function, *args)
+    metrics.replay(observations)
+    return result
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.start_recording()
+
+@app.after_request
+def record_request_metrics(response):
+    observations = metrics.stop_recording()
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else 'unknown'
+    metrics.request_count.inc(endpoint, response.status_code)
+    metrics.request_seconds.observe(elapsed, endpoint)
+    if (METRICS_TIMING_HEADER):
+        observations.append(('stage', elapsed, 'total'))
+        response.headers['Server-Timing'] = metrics.server_timing(observations)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.registry.render(),
+                    mimetype='text/plain; version=0.0.4')
+
+class InvalidRequest(Exception):
+    pass
+
+@app.errorhandler(InvalidRequest)
+def handle_invalid_request(error):
+    return json.dumps({'error': 'invalid request', 'message': str(error)}), 400
+
+@app.errorhandler(PoolBusy)
+def handle_pool_busy(error):
+    return json.dumps({'error': 'busy', 'message': str(error)}), 503, \
+        {'Retry-After': '1'}
+
+@app.errorhandler(DeadlineExceeded)
+def handle_deadline_exceeded(error):
+    return json.dumps({'error': 'timeout', 'message': str(error)}), 504
+
+def get_dataframe():
+    data = price_store.get().data
+    return data['stock'], data['nasdaq100']
+
+def get_window_statistics(years, data=None):
+    """
+    - (stock statistics, nasdaq100 statistics) of the last `years` years,
+      precomputed on every data refresh for years in VALID_YEARS
+    """
+    if (data is None):
+        data = price_store.get().data
+    if (years in data['statistics']):
+        return data['statistics'][years], data['nasdaq100_statistics'][years]
+    start_date = get_window_start_date(years)
+    return compute_window_statistics(data['stock'], start_date), \
+        compute_window_statistics(data['nasdaq100'], start_date)
+
+def estimate_window_covariance(snapshot, years, statistics, covariance,
+                               expires_at):
+    """
+    - statistics with the covariance of the covariance estimator, computed
+      on all tickers of the window once per data version
+    """
+    if (covariance == 'sample'):
+        return statistics
+    cov_matrix = covariance_cache.get_or_compute(
+        (years, covariance, snapshot.version),
+        lambda: estimate_covariance(statistics.daily_returns, covariance),
+        expires_at)
+    return statistics._replace(cov_matrix=cov_matrix)
+
+def print_result(weights, mean_returns, cov_matrix, risk_free_rate):
+    port_return = portfolio_return(weights, mean_returns, cov_matrix)
+    port_std = portfolio_standard_deviation(weights, mean_returns, cov_matrix)
     port_sharpe = (port_return - risk_free_rate) / port_std
     # print('return', port_return)
     # print('std   ', port_std)
@@ -90,7 +283,7 @@ def calulate_return_from_risk_factor(risk_factor, bottom, middle, top):
     elif (risk_factor == 1):
         return top
     elif (risk_factor < 0 or risk_factor > 1):
-        raise 'risk_factor must be in between 0 and 1'
+        raise ValueError('risk_factor must be in between 0 and 1')
 
     if (risk_factor < 0.5):
         risk_factor = risk_factor * 2
@@ -109,65 +302,129 @@ def what_to_buy(tickers, weights):
     # print()
     return what_to_buy_list
 
-# tickers must be in preset
-# risk_free_rate = 0.0 - 1.0
-# year = 1, 2, 3, ..., 9
-# risk_factor = 0.0 - 1.0
-@app.route('/get_optimal_portfolio', methods=['POST'])
-def get_optimal_port():
-    print('request', request.get_json())
-    requested_data = request.get_json()
-
-    tickers = requested_data.get('tickers', get_tickers_without_ndx())
-    risk_factor = float(requested_data.get('risk_factor', 0.5))
-    years = int(requested_data.get('years', 5))
-    risk_free_rate = float(requested_data.get('risk_free_rate', 0.025))
-
-    df, nasdaq100_df = get_dataframe()
-
-    # filter tickers
-    df = df[ map(lambda x: x.upper(), tickers) ]
-
-    # filter date
-    start_date = str(datetime.now() - timedelta(days=365*years)).split(' ')[0]
-    df = df.loc[df.index > start_date]
-    nasdaq100_df = nasdaq100_df.loc[df.index > start_date]
-
+def normalize_tickers(tickers):
+    return tuple(sorted(set(map(lambda x: x.upper(), tickers))))
 
+def get_nasdaq_performance(statistics_ndx, risk_free_rate):
+    return print_result(np.array([1]), statistics_ndx.mean_returns,
+                        statistics_ndx.cov_matrix, risk_free_rate)
 
-    daily_returns_ndx = nasdaq100_df.pct_change()
-    cov_matrix_ndx = daily_returns_ndx.cov()
+def get_anchor_returns(statistics, statistics_ndx, risk_free_rate):
+    mean_returns = statistics.mean_returns
+    cov_matrix = statistics.cov_matrix
 
-    daily_returns = df.pct_change()
-    cov_matrix = daily_returns.cov()
+    with metrics.timed('anchor_points'):
+        anchors = find_anchor_points(mean_returns, cov_matrix, risk_free_rate)
+    for name, anchor in anchors.items():
+        metrics.record_solver(name, anchor)
+    min_std = anchors['minimum_standard_deviation']['x']
+    max_sharpe = anchors['maximum_sharpe_ratio']['x']
+    max_return = anchors['maximum_return']['x']
 
-    min_std = find_minimum_standard_deviation_point(daily_returns.mean(), cov_matrix)['x']
-    max_sharpe = find_maximum_sharpe_ratio_point(daily_returns.mean(), cov_matrix, risk_free_rate)['x']
-    max_return = find_maximum_return_point(daily_returns.mean(), cov_matrix)['x']
-    
     # print('nasdaq')
-    nasdaq_return, nasdaq_std, nasdaq_sharpe = print_result(np.array([1]), daily_returns_ndx, cov_matrix_ndx, risk_free_rate)
+    nasdaq = get_nasdaq_performance(statistics_ndx, risk_free_rate)
 
     # print('min std')
-    bottom_return, _, _ = print_result(min_std, daily_returns, cov_matrix, risk_free_rate)
+    bottom_return, _, _ = print_result(min_std, mean_returns, cov_matrix, risk_free_rate)
 
     # print('max_sharpe')
-    middle_return, _, _ = print_result(max_sharpe, daily_returns, cov_matrix, risk_free_rate)
+    middle_return, _, _ = print_result(max_sharpe, mean_returns, cov_matrix, risk_free_rate)
 
     # print('max return')
-    top_return, _, _ = print_result(max_return, daily_returns, cov_matrix, risk_free_rate)
-
-    target_return = calulate_return_from_risk_factor(risk_factor, bottom_return, middle_return, top_return)
-    choosen = find_efficient_return(daily_returns.mean(), cov_matrix, target_return)['x']
+    top_return, _, _ = print_result(max_return, mean_returns, cov_matrix, risk_free_rate)
+
+    return nasdaq, (bottom_return, middle_return, top_return), \
+        (min_std, max_sharpe, max_return)
+
+def get_ticker_statistics(snapshot, tickers, years, expires_at,
+                          covariance='sample'):
+    """
+    - (statistics of tickers, statistics of ^NDX) over the last years
+    """
+    with metrics.timed('statistics'):
+        # filter date
+        statistics, statistics_ndx = get_window_statistics(years, snapshot.data)
+        statistics = estimate_window_covariance(
+            snapshot, years, statistics, covariance, expires_at)
+
+        # filter tickers
+        statistics = select_tickers(statistics, list(tickers))
+    return statistics, statistics_ndx
+
+def get_anchor_key(tickers, years, risk_free_rate, covariance, version):
+    """
+    - key of the anchor points shared by every request with the same
+      tickers, years, risk_free_rate and covariance; tickers =
+      normalize_tickers output
+    """
+    return (tickers, years, risk_free_rate, covariance, version)
+
+def get_portfolio_group(snapshot, tickers, years, risk_free_rate, expires_at,
+                        covariance='sample', anchors=None):
+    """
+    - (statistics of tickers, anchors) shared by every request with the
+      same tickers, years, risk_free_rate and covariance; tickers =
+      normalize_tickers output, anchors = get_anchor_returns output,
+      computed unless already known
+    """
+    statistics, statistics_ndx = get_ticker_statistics(
+        snapshot, tickers, years, expires_at, covariance)
+    if (anchors is None):
+        anchors = get_anchor_returns(statistics, statistics_ndx, risk_free_rate)
+    return statistics, anchors
+
+def solve_optimal_portfolio(tickers, risk_factor, risk_free_rate,
+                            statistics, anchors):
+    """
+    - the 'nasdaq_index' and 'portfolio' parts of the response, from the
+      output of get_portfolio_group
+    """
+    nasdaq, anchor_returns, anchor_weights = anchors
+    mean_returns = statistics.mean_returns
+    cov_matrix = statistics.cov_matrix
+
+    target_return = calulate_return_from_risk_factor(risk_factor, *anchor_returns)
+    # the same mix of the two neighboring anchor portfolios has exactly
+    # the target return, so the solver starts feasible and close
+    initial_weights = calulate_return_from_risk_factor(
+        risk_factor, *anchor_weights)
+    with metrics.timed('efficient_return'):
+        choosen_result = find_efficient_return(mean_returns, cov_matrix,
+            target_return, method='active_set', initial_weights=initial_weights)
+        if (not choosen_result['success']):
+            choosen_result = find_efficient_return(
+                mean_returns, cov_matrix, target_return)
+    metrics.record_solver('efficient_return', choosen_result)
     # print('risk_factor', risk_factor)
-    choosen_return, choosen_std, choosen_sharpe = print_result(choosen, daily_returns, cov_matrix, risk_free_rate)
-    
+    return make_portfolio_result(tickers, choosen_result['x'], mean_returns,
+        cov_matrix, risk_free_rate, nasdaq)
+
+def solve_hierarchical_risk_parity_portfolio(tickers, risk_free_rate,
+                                             statistics, statistics_ndx):
+    """
+    - solve_optimal_portfolio with the hierarchical risk parity weights,
+      which need neither anchor points nor a solver
+    """
+    mean_returns = statistics.mean_returns
+    cov_matrix = statistics.cov_matrix
+    with metrics.timed('hierarchical_risk_parity'):
+        result = find_hierarchical_risk_parity_point(mean_returns, cov_matrix)
+    metrics.record_solver('hierarchical_risk_parity', result)
+    return make_portfolio_result(tickers, result['x'], mean_returns,
+        cov_matrix, risk_free_rate,
+        get_nasdaq_performance(statistics_ndx, risk_free_rate))
+
+def make_portfolio_result(tickers, choosen, mean_returns, cov_matrix,
+                          risk_free_rate, nasdaq):
+    nasdaq_return, nasdaq_std, nasdaq_sharpe = nasdaq
+    choosen_return, choosen_std, choosen_sharpe = print_result(choosen, mean_returns, cov_matrix, risk_free_rate)
+
     what_to_buy_list = what_to_buy(tickers, choosen)
     what_to_buy_list.sort(key = lambda item: item[1])
     what_to_buy_list.reverse()
 
-    response = {
-        'nasdaq_index': { 
+    return {
+        'nasdaq_index': {
             'return': nasdaq_return,
             'std': nasdaq_std,
             'sharpe': nasdaq_sharpe
@@ -177,15 +434,339 @@ def get_optimal_port():
             'std': choosen_std,
             'sharpe': choosen_sharpe,
             'what_to_buy': what_to_buy_list
-        },
+        }
+    }
+
+def get_result_key(portfolio_request, version):
+    tickers, risk_factor, years, risk_free_rate, covariance, method = \
+        portfolio_request
+    if (method == 'hierarchical_risk_parity'):
+        risk_factor = None
+    return get_anchor_key(normalize_tickers(tickers), years, risk_free_rate,
+                          covariance, version) + (method, risk_factor)
+
+def solve_optimal_portfolios(portfolio_requests, anchors):
+    """
+    - portfolio_requests = [(tickers, risk_factor, years, risk_free_rate,
+      covariance, method), ...], anchors = {get_anchor_key: anchor points}
+      already known
+    - requests with the same ticker set, years, risk_free_rate, covariance
+      and method share one window statistics selection and one set of
+      anchor points, and each distinct risk_factor among them is solved
+      once; 'hierarchical_risk_parity' ignores risk_factor and needs no
+      anchor points
+    - return ([compute_optimal_portfolio result, ...] in request order,
+      {get_anchor_key: anchor points} computed on the way)
+    """
+    with metrics.timed('data_load'):
+        snapshot = price_store.get()
+    expires_at = price_store.next_refresh_time()
+
+    groups = {}
+    for index, portfolio_request in enumerate(portfolio_requests):
+        result_key = get_result_key(portfolio_request, snapshot.version)
+        groups.setdefault(result_key[:-1], {}) \
+            .setdefault(result_key[-1], []).append(index)
+
+    results = [None] * len(portfolio_requests)
+    computed_anchors = {}
+    for (tickers, years, risk_free_rate, covariance, version, method), \
+            indices_by_risk_factor in groups.items():
+        anchor_key = get_anchor_key(tickers, years, risk_free_rate,
+                                    covariance, version)
+        if (method == 'hierarchical_risk_parity'):
+            result = solve_hierarchical_risk_parity_portfolio(
+                tickers, risk_free_rate, *get_ticker_statistics(
+                    snapshot, tickers, years, expires_at, covariance))
+            for index in indices_by_risk_factor[None]:
+                results[index] = result
+            continue
+
+        statistics, group_anchors = get_portfolio_group(snapshot, tickers,
+            years, risk_free_rate, expires_at, covariance,
+            anchors.get(anchor_key))
+        if (anchor_key not in anchors):
+            computed_anchors[anchor_key] = group_anchors
+        for risk_factor, indices in indices_by_risk_factor.items():
+            result = solve_optimal_portfolio(tickers, risk_factor,
+                risk_free_rate, statistics, group_anchors)
+            for index in indices:
+                results[index] = result
+    return results, computed_anchors
+
+def compute_optimal_portfolios(portfolio_requests):
+    """
+    - portfolio_requests = [(tickers, risk_factor, years, risk_free_rate,
+      covariance, method), ...]
+    - results are cached per request and data version until the next
+      data refresh; anchor points are cached separately so a new
+      risk_factor only pays for the final find_efficient_return, which
+      starts from the anchor portfolios
+    - the caches are looked up in the request process, and only the
+      requests that missed are solved with run_optimization, so cached
+      answers are never queued behind the worker pool
+    - return [compute_optimal_portfolio result, ...] in request order
+    """
+    snapshot = price_store.get()
+    expires_at = price_store.next_refresh_time()
+    result_keys = [get_result_key(portfolio_request, snapshot.version)
+                   for portfolio_request in portfolio_requests]
+    missing = object()
+    results = [result_cache.get(result_key, missing)
+               for result_key in result_keys]
+    missing_indices = [index for index, result in enumerate(results)
+                       if result is missing]
+    if (not missing_indices):
+        return results
+
+    anchors = {}
+    for index in missing_indices:
+        anchor_key = result_keys[index][:-2]
+        if (anchor_key not in anchors):
+            anchor = anchor_cache.get(anchor_key)
+            if (anchor is not None):
+                anchors[anchor_key] = anchor
+    solved, computed_anchors = run_optimization(solve_optimal_portfolios,
+        [portfolio_requests[index] for index in missing_indices], anchors)
+    for anchor_key, anchor in computed_anchors.items():
+        anchor_cache.set(anchor_key, anchor, expires_at)
+    for index, result in zip(missing_indices, solved):
+        result_cache.set(result_keys[index], result, expires_at)
+        results[index] = result
+    return results
+
+def compute_optimal_portfolio(tickers, risk_factor, years, risk_free_rate,
+                              covariance='sample', method='efficient_return'):
+    """
+    - the 'nasdaq_index' and 'portfolio' parts of the response
+    """
+    return compute_optimal_portfolios(
+        [(tickers, risk_factor, years, risk_free_rate, covariance, method)])[0]
+
+def parse_covariance(requested_data):
+    covariance = requested_data.get('covariance', 'sample')
+    try:
+        get_covariance_estimator(covariance)
+    except ValueError as error:
+        raise InvalidRequest(str(error))
+    return covariance
+
+PORTFOLIO_METHODS = ('efficient_return', 'hierarchical_risk_parity')
+
+def parse_method(requested_data):
+    method = requested_data.get('method', 'efficient_return')
+    if (method not in PORTFOLIO_METHODS):
+        raise InvalidRequest('method must be one of %s'
+                             % sorted(PORTFOLIO_METHODS))
+    return method
+
+def parse_risk_factor(requested_data):
+    risk_factor = requested_data.get('risk_factor', 0.5)
+    if (isinstance(risk_factor, bool) \
+        or not isinstance(risk_factor, (int, float)) \
+        or not 0 <= risk_factor <= 1):
+        raise InvalidRequest('risk_factor must be a number between 0 and 1')
+    return float(risk_factor)
+
+def parse_portfolio_request(requested_data):
+    """
+    - (tickers, risk_factor, years, risk_free_rate, covariance, method) of
+      a request body, with the defaults filled in
+    """
+    tickers = requested_data.get('tickers', get_tickers_without_ndx())
+    risk_factor = parse_risk_factor(requested_data)
+    years = int(requested_data.get('years', 5))
+    risk_free_rate = float(requested_data.get('risk_free_rate', 0.025))
+    covariance = parse_covariance(requested_data)
+    method = parse_method(requested_data)
+    return tickers, risk_factor, years, risk_free_rate, covariance, method
+
+def make_portfolio_response(tickers, risk_factor, years, risk_free_rate,
+                            covariance, method, result):
+    return {
+        'nasdaq_index': result['nasdaq_index'],
+        'portfolio': result['portfolio'],
         'options': {
             'tickers': 'All' if len(tickers) == 95 else tickers,
             'risk_factor': risk_factor,
             'risk_free_rate': risk_free_rate,
-            'years': years
+            'years': years,
+            'covariance': covariance,
+            'method': method
         }
     }
 
+# tickers must be in preset
+# risk_free_rate = 0.0 - 1.0
+# year = 1, 2, 3, ..., 9
+# risk_factor = 0.0 - 1.0
+# covariance = 'sample', 'ledoit_wolf', 'constant_correlation', 'ewma' or
+#              'factor'
+# method = 'efficient_return' (portfolio at risk_factor between the minimum
+#          standard deviation and maximum return portfolios) or
+#          'hierarchical_risk_parity' (ignores risk_factor)
+@app.route('/get_optimal_portfolio', methods=['POST'])
+def get_optimal_port():
+    print('request', request.get_json())
+    requested_data = request.get_json()
+
+    options = parse_portfolio_request(requested_data)
+    result = compute_optimal_portfolio(*options)
+    response = make_portfolio_response(*options, result)
+
     print('response', json.dumps(response, indent=4))
 
-    return json.dumps(response)
\ No newline at end of file
+    with metrics.timed('serialization'):
+        return json.dumps(response)
+
+# requests = list of at most PORTFOLIO_BATCH_MAX_REQUESTS
+#            /get_optimal_portfolio request bodies
+# response = list of /get_optimal_portfolio responses, in the same order
+@app.route('/get_optimal_portfolios', methods=['POST'])
+def get_optimal_ports():
+    requested_data = request.get_json()
+
+    portfolio_requests = requested_data.get('requests', [])
+    if (not isinstance(portfolio_requests, list)):
+        raise InvalidRequest('requests must be a list')
+    if (len(portfolio_requests) > PORTFOLIO_BATCH_MAX_REQUESTS):
+        raise InvalidRequest('at most %d requests per batch'
+                             % PORTFOLIO_BATCH_MAX_REQUESTS)
+    options_list = [parse_portfolio_request(item)
+                    for item in portfolio_requests]
+    results = compute_optimal_portfolios(options_list)
+    response = [make_portfolio_response(*options, result)
+                for options, result in zip(options_list, results)]
+
+    with metrics.timed('serialization'):
+        return json.dumps(response)
+
+def solve_efficient_frontier(tickers, years, risk_free_rate, num_points,
+                             covariance, anchors):
+    """
+    - efficient frontier of tickers from the corner portfolios of the
+      critical line algorithm, num_points portfolios evenly spaced in
+      return from the minimum standard deviation to the maximum return
+    - tickers = normalize_tickers output, anchors = get_anchor_returns
+      output if already known
+    - arrays are np.ndarray, encoded by the caller in the requested format
+    - return (frontier, anchors)
+    """
+    with metrics.timed('data_load'):
+        snapshot = price_store.get()
+    expires_at = price_store.next_refresh_time()
+    statistics, anchors = get_portfolio_group(snapshot, tickers, years,
+        risk_free_rate, expires_at, covariance, anchors)
+    (nasdaq_return, nasdaq_std, nasdaq_sharpe), _, anchor_weights = anchors
+    mean_returns = statistics.mean_returns
+    cov_matrix = np.asarray(statistics.cov_matrix)
+
+    with metrics.timed('critical_line'):
+        corners = critical_line_algorithm(mean_returns, cov_matrix)
+        target_returns = np.linspace(
+            corners['returns'][-1], corners['returns'][0], num_points)
+        weights = frontier_weights(corners, target_returns)
+        returns = weights.dot(np.asarray(mean_returns)) * 252
+        stds = np.sqrt(np.einsum('ij,jk,ik->i', weights, cov_matrix,
+                                 weights) * 252)
+
+    anchor_portfolios = {}
+    for name, anchor in zip(['minimum_standard_deviation',
+                             'maximum_sharpe_ratio', 'maximum_return'],
+                            anchor_weights):
+        anchor_return, anchor_std, anchor_sharpe = print_result(
+            anchor, mean_returns, cov_matrix, risk_free_rate)
+        anchor_portfolios[name] = {
+            'return': anchor_return,
+            'std': anchor_std,
+            'sharpe': anchor_sharpe,
+            'weights': np.asarray(anchor, dtype=float)
+        }
+
+    result = {
+        'tickers': list(tickers),
+        'nasdaq_index': {
+            'return': nasdaq_return,
+            'std': nasdaq_std,
+            'sharpe': nasdaq_sharpe
+        },
+        'frontier': {
+            'return': returns,
+            'std': stds,
+            'sharpe': (returns - risk_free_rate) / stds
+        },
+        'corner_portfolios': {
+            'return': corners['returns'],
+            'std': corners['stds'],
+            'lambda': corners['lambdas'],
+            'weights': corners['weights']
+        },
+        'anchors': anchor_portfolios
+    }
+    return result, anchors
+
+def compute_efficient_frontier(tickers, years, risk_free_rate, num_points,
+                               covariance='sample'):
+    """
+    - solve_efficient_frontier output, cached per (tickers, years,
+      risk_free_rate, num_points, covariance) and data version until the
+      next data refresh
+    - like compute_optimal_portfolios, the caches are looked up in the
+      request process and only a miss is solved with run_optimization
+    """
+    snapshot = price_store.get()
+    expires_at = price_store.next_refresh_time()
+    tickers = normalize_tickers(tickers)
+    frontier_key = (tickers, years, risk_free_rate, num_points, covariance,
+                    snapshot.version)
+    missing = object()
+    result = frontier_cache.get(frontier_key, missing)
+    if (result is missing):
+        anchor_key = get_anchor_key(tickers, years, risk_free_rate,
+                                    covariance, snapshot.version)
+        result, anchors = run_optimization(solve_efficient_frontier, tickers,
+            years, risk_free_rate, num_points, covariance,
+            anchor_cache.get(anchor_key))
+        anchor_cache.set(anchor_key, anchors, expires_at)
+        frontier_cache.set(frontier_key, result, expires_at)
+    return result
+
+# tickers, risk_free_rate, years and covariance as in /get_optimal_portfolio
+# num_points = 2 - FRONTIER_MAX_POINTS
+# format = 'json': arrays are lists of numbers
+#          'base64': arrays are {'dtype': '<f4', 'shape', 'data': <base64>}
+#          'binary': application/octet-stream, see encoding.to_binary
+@app.route('/efficient_frontier', methods=['POST'])
+def get_efficient_frontier():
+    requested_data = request.get_json()
+
+    tickers = requested_data.get('tickers', get_tickers_without_ndx())
+    years = int(requested_data.get('years', 5))
+    risk_free_rate = float(requested_data.get('risk_free_rate', 0.025))
+    num_points = min(max(int(requested_data.get('num_points', FRONTIER_POINTS)),
+                         2), FRONTIER_MAX_POINTS)
+    covariance = parse_covariance(requested_data)
+    response_format = requested_data.get('format', 'json')
+    if (response_format not in ('json', 'base64', 'binary')):
+        raise InvalidRequest('format must be json, base64 or binary')
+
+    result = compute_efficient_frontier(
+        tickers, years, risk_free_rate, num_points, covariance)
+
+    response = dict(result)
+    response['options'] = {
+        'tickers': 'All' if len(tickers) == 95 else tickers,
+        'risk_free_rate': risk_free_rate,
+        'years': years,
+        'num_points': num_points,
+        'covariance': covariance,
+        'format': response_format
+    }
+
+    with metrics.timed('serialization'):
+        if (response_format == 'binary'):
+            return Response(to_binary(response),
+                            mimetype='application/octet-stream')
+        if (response_format == 'base64'):
+            return json.dumps(to_base64_arrays(response), allow_nan=False)
+        return json.dumps(to_json_lists(response), allow_nan=False)
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+- offline benchmarks of the optimization hot paths on synthetic markets,
+  run from the repository root
+    python -m benchmarks --output baseline.json
+    python -m benchmarks --compare baseline.json --threshold 1.25
+    python -m benchmarks --sizes 5 95 2000 --missing mixed --filter active_set
+- exits with status 1 when a benchmark fails, or when --compare finds a
+  slowdown or a baseline benchmark that did not run
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from benchmarks.cases import (
+    BENCHMARKS,
+    quiet
+)
+
+from benchmarks.market import (
+    MISSING_PATTERNS,
+    generate_market
+)
+
+def measure(function, repeat, budget):
+    """
+    - seconds per call over up to repeat calls after one warm-up call,
+      stopping early once budget seconds are spent
+    """
+    function()
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeat:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+        if (time.perf_counter() - started > budget):
+            break
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'repeat': len(times)
+    }
+
+def run_benchmarks(sizes, days, missing, seed, repeat, budget, pattern=None):
+    results = {}
+    for num_assets in sizes:
+        market = generate_market(num_assets, days, seed=seed, missing=missing)
+        for benchmark in BENCHMARKS:
+            name = '%s[n=%d]' % (benchmark.name, num_assets)
+            if (num_assets > benchmark.max_assets \
+                or (pattern and pattern not in name)):
+                continue
+            try:
+                function = quiet(benchmark.setup(market))
+                results[name] = measure(function, repeat, budget)
+            except Exception:
+                traceback.print_exc()
+                results[name] = {'error': traceback.format_exc(limit=1)}
+            print_result(name, results[name])
+    return results
+
+def get_size(name):
+    return int(name[name.rindex('[n=') + 3:-1])
+
+def print_result(name, result, baseline=None, threshold=None):
+    if ('error' in result):
+        print('%-60s %12s' % (name, 'error'))
+        return 'ERROR'
+    line = '%-60s %10.3f ms' % (name, result['median'] * 1000)
+    status = None
+    if (baseline is not None and 'median' in baseline):
+        ratio = result['median'] / baseline['median']
+        status = 'SLOWER' if ratio > threshold \
+            else 'faster' if ratio < 1 / threshold else 'same'
+        line += '  %10.3f ms  x%.2f  %s' % (
+            baseline['median'] * 1000, ratio, status)
+    print(line)
+    return status
+
+def compare(results, baseline_results, threshold, sizes, pattern=None):
+    """
+    - print results next to the baseline, return (names that are more than
+      threshold times slower, names that failed)
+    - a benchmark fails when it raised, or when it is in the baseline for
+      one of sizes and matches pattern but did not run, e.g. because it
+      was removed or renamed
+    """
+    print('')
+    print('%-60s %13s  %13s' % ('benchmark', 'median', 'baseline'))
+    slower = []
+    failed = []
+    for name, result in results.items():
+        status = print_result(name, result, baseline_results.get(name),
+                              threshold)
+        if (status == 'SLOWER'):
+            slower.append(name)
+        elif (status == 'ERROR'):
+            failed.append(name)
+    for name in baseline_results:
+        if (name not in results and get_size(name) in sizes \
+            and (not pattern or pattern in name)):
+            print('%-60s %12s' % (name, 'missing'))
+            failed.append(name)
+    return slower, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 20, 95, 500])
+    parser.add_argument('--days', type=int, default=1260,
+                        help='business days of history')
+    parser.add_argument('--missing', choices=MISSING_PATTERNS, default='none')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=5.,
+                        help='seconds per benchmark before stopping early')
+    parser.add_argument('--filter', help='only benchmarks containing this')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='baseline json file to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='median ratio reported as a slowdown')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.days, args.missing, args.seed,
+                             args.repeat, args.budget, args.filter)
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'pandas': pd.__version__,
+            'days': args.days,
+            'missing': args.missing,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    if (args.output):
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4, sort_keys=True)
+
+    if (args.compare):
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        for key in ('days', 'missing', 'seed'):
+            if (baseline['meta'].get(key) != report['meta'][key]):
+                print('warning: baseline %s is %s, not %s'
+                      % (key, baseline['meta'].get(key), report['meta'][key]))
+        slower, failed = compare(results, baseline['results'],
+                                 args.threshold, args.sizes, args.filter)
+        if (slower or failed):
+            print('')
+            if (slower):
+                print('%d benchmarks are slower than the baseline'
+                      % len(slower))
+            if (failed):
+                print('%d benchmarks failed or did not run' % len(failed))
+            return 1
+    if (any('error' in result for result in results.values())):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
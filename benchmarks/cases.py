@@ -0,0 +1,210 @@
+import contextlib
+import io
+from collections import namedtuple
+
+import numpy as np
+
+from functions.covariance import (
+    estimate_covariance
+)
+
+from functions.portfolio import (
+    find_anchor_points,
+    find_efficient_return,
+    find_hierarchical_risk_parity_point,
+    find_maximum_return_point,
+    find_maximum_sharpe_ratio_point,
+    find_minimum_standard_deviation_point,
+    find_portfolio_with_risk_aversion
+)
+
+from functions.efficient_frontier import (
+    efficient_frontier,
+    random_portfolios
+)
+
+from functions.return_function import (
+    black_litterman_returns_function,
+    mean_returns_function
+)
+
+from functions.test_performance import (
+    test_portfolio_performance
+)
+
+from .market import (
+    generate_views
+)
+
+RISK_FREE_RATE = 0.025
+
+# setup(market) returns the function that is timed; cases are skipped for
+# markets with more than max_assets assets
+Benchmark = namedtuple('Benchmark', ['name', 'setup', 'max_assets'])
+
+def complete_statistics(market):
+    """
+    - (daily returns, mean returns, covariance) of the tickers without
+      missing prices, like api.load_dataframe keeps
+    """
+    prices = market.prices.dropna(axis=1)
+    daily_returns = prices.pct_change()
+    return daily_returns, daily_returns.mean(), daily_returns.cov()
+
+def factor_statistics(market):
+    """
+    - complete_statistics with a FactorCovariance instead of the sample
+      covariance, which is not computed
+    """
+    daily_returns = market.prices.dropna(axis=1).pct_change()
+    return daily_returns, daily_returns.mean(), \
+        estimate_covariance(daily_returns, 'factor')
+
+def middle_target(mean_returns, cov_matrix):
+    lowest = np.dot(find_minimum_standard_deviation_point(
+        mean_returns, cov_matrix, method='active_set')['x'], mean_returns)
+    return (lowest + np.max(mean_returns)) * 252 / 2
+
+def solver_case(function, method, max_assets, statistics=complete_statistics,
+                **kwargs):
+    def setup(market):
+        _, mean_returns, cov_matrix = statistics(market)
+        args = [mean_returns, cov_matrix]
+        if (function is find_maximum_sharpe_ratio_point):
+            args.append(RISK_FREE_RATE)
+        elif (function is find_portfolio_with_risk_aversion):
+            args.append(3.)
+        elif (function is find_efficient_return):
+            args.append(middle_target(mean_returns, cov_matrix))
+        return lambda: function(*args, method=method, **kwargs)
+    name = '%s[%s]' % (function.__name__, method)
+    if (statistics is factor_statistics):
+        name = '%s[%s,factor]' % (function.__name__, method)
+    return Benchmark(name, setup, max_assets)
+
+def covariance_case(estimator):
+    def setup(market):
+        daily_returns, _, _ = complete_statistics(market)
+        return lambda: estimate_covariance(daily_returns, estimator)
+    return Benchmark('estimate_covariance[%s]' % estimator, setup, 2000)
+
+def anchor_points_case(statistics):
+    def setup(market):
+        _, mean_returns, cov_matrix = statistics(market)
+        return lambda: find_anchor_points(
+            mean_returns, cov_matrix, RISK_FREE_RATE)
+    return setup
+
+def hierarchical_risk_parity_case(statistics):
+    def setup(market):
+        _, mean_returns, cov_matrix = statistics(market)
+        return lambda: find_hierarchical_risk_parity_point(
+            mean_returns, cov_matrix)
+    return setup
+
+def efficient_frontier_case(method, num_points=20):
+    def setup(market):
+        _, mean_returns, cov_matrix = complete_statistics(market)
+        lowest = np.dot(find_minimum_standard_deviation_point(
+            mean_returns, cov_matrix, method='active_set')['x'], mean_returns)
+        target_returns = np.linspace(lowest * 252,
+            np.max(mean_returns) * 252, num_points)
+        return lambda: efficient_frontier(
+            mean_returns, cov_matrix, target_returns, method=method)
+    return setup
+
+def random_portfolios_case(market):
+    _, mean_returns, cov_matrix = complete_statistics(market)
+    return lambda: random_portfolios(
+        20000, mean_returns, cov_matrix, RISK_FREE_RATE)
+
+def black_litterman_case(market):
+    daily_returns, _, _ = complete_statistics(market)
+    tickers = list(daily_returns.columns)
+    views = generate_views(tickers, max(len(tickers) // 5, 1))
+    return lambda: black_litterman_returns_function(
+        daily_returns, tickers=tickers, market_cap=market.market_caps,
+        risk_free_rate=RISK_FREE_RATE, views=views)
+
+def walk_forward_case(market):
+    prices = market.prices
+    training_period = min(252, len(prices) // 2)
+    return lambda: test_portfolio_performance(
+        prices, mean_returns_function, RISK_FREE_RATE,
+        testing_period=len(prices) - training_period,
+        rebalancing_period=63, slicing=True)
+
+def get_optimal_port_case(market):
+    # imported here, the other cases do not need flask
+    import api
+    from price_store import PriceStore
+
+    prices = market.prices.dropna(axis=1)
+    index_prices = market.index_prices.dropna(axis=0)
+    api.price_store = PriceStore(
+        lambda: api.build_price_data(prices, index_prices))
+    api.price_store.get()
+    body = {
+        'tickers': list(prices.columns),
+        'risk_factor': 0.3,
+        'years': 3,
+        'risk_free_rate': RISK_FREE_RATE
+    }
+
+    def run():
+        # every call pays for the anchor points and the final solve
+        api.result_cache.clear()
+        api.anchor_cache.clear()
+        with api.app.test_request_context(json=body):
+            return api.get_optimal_port()
+    return run
+
+BENCHMARKS = [
+    solver_case(find_minimum_standard_deviation_point, 'SLSQP', 100),
+    solver_case(find_minimum_standard_deviation_point, 'active_set', 2000),
+    solver_case(find_maximum_sharpe_ratio_point, 'SLSQP', 100),
+    solver_case(find_maximum_sharpe_ratio_point, 'active_set', 2000),
+    solver_case(find_maximum_return_point, 'SLSQP', 100),
+    solver_case(find_maximum_return_point, 'active_set', 2000),
+    solver_case(find_efficient_return, 'SLSQP', 100),
+    solver_case(find_efficient_return, 'active_set', 2000),
+    solver_case(find_portfolio_with_risk_aversion, 'SLSQP', 100),
+    solver_case(find_portfolio_with_risk_aversion, 'active_set', 500),
+    covariance_case('sample'),
+    covariance_case('ledoit_wolf'),
+    covariance_case('constant_correlation'),
+    covariance_case('ewma'),
+    covariance_case('factor'),
+    solver_case(find_minimum_standard_deviation_point, 'active_set', 5000,
+                factor_statistics),
+    solver_case(find_maximum_sharpe_ratio_point, 'active_set', 5000,
+                factor_statistics),
+    solver_case(find_efficient_return, 'active_set', 5000, factor_statistics),
+    Benchmark('find_anchor_points', anchor_points_case(complete_statistics),
+              2000),
+    Benchmark('find_anchor_points[factor]',
+              anchor_points_case(factor_statistics), 5000),
+    Benchmark('find_hierarchical_risk_parity_point',
+              hierarchical_risk_parity_case(complete_statistics), 2000),
+    Benchmark('find_hierarchical_risk_parity_point[factor]',
+              hierarchical_risk_parity_case(factor_statistics), 5000),
+    Benchmark('efficient_frontier[SLSQP]',
+              efficient_frontier_case('SLSQP'), 100),
+    Benchmark('efficient_frontier[active_set]',
+              efficient_frontier_case('active_set'), 500),
+    Benchmark('efficient_frontier[critical_line]',
+              efficient_frontier_case('critical_line'), 2000),
+    Benchmark('random_portfolios', random_portfolios_case, 2000),
+    Benchmark('black_litterman_returns_function', black_litterman_case, 2000),
+    Benchmark('test_portfolio_performance', walk_forward_case, 500),
+    Benchmark('get_optimal_port', get_optimal_port_case, 2000)
+]
+
+def quiet(function):
+    """
+    - function with its prints discarded
+    """
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return run
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from datetime import date
+
+SyntheticMarket = namedtuple(
+    'SyntheticMarket', ['prices', 'index_prices', 'market_caps'])
+
+MISSING_PATTERNS = ('none', 'listings', 'gaps', 'delistings', 'mixed')
+
+def get_tickers(num_assets):
+    return ['S%04d' % i for i in range(num_assets)]
+
+def generate_market(num_assets, num_days, seed=0, missing='none',
+                    end_date=None, num_sectors=10):
+    """
+    - seeded daily close prices from a one market, num_sectors sector
+      factor model, with an index like ^NDX (cap-weighted) and market caps
+    - num_days business days ending at end_date (default today), so the
+      last-`years` windows of api.py fall inside the history
+    - missing = 'none'
+                'listings'   (some assets start trading late)
+                'gaps'       (short runs of missing prices)
+                'delistings' (some assets stop trading early)
+                'mixed'      (all of the above)
+    - return SyntheticMarket(prices = <pd.DataFrame> one column per ticker,
+                             index_prices = <pd.DataFrame> column '^NDX',
+                             market_caps = {ticker: market cap})
+    """
+    if (missing not in MISSING_PATTERNS):
+        raise ValueError('missing must be one of %s' % (MISSING_PATTERNS,))
+    random_state = np.random.RandomState(seed)
+    tickers = get_tickers(num_assets)
+    index = pd.bdate_range(end=end_date or date.today(), periods=num_days,
+                           name='Date')
+
+    market = random_state.normal(0.0004, 0.011, num_days)
+    sectors = random_state.normal(0., 0.007, (num_days, num_sectors))
+    sector_of = random_state.randint(num_sectors, size=num_assets)
+    betas = random_state.uniform(0.5, 1.6, num_assets)
+    alphas = random_state.normal(0.0002, 0.0003, num_assets)
+    volatilities = random_state.uniform(0.008, 0.03, num_assets)
+    daily_returns = alphas + market[:, np.newaxis] * betas \
+        + sectors[:, sector_of] \
+        + random_state.normal(size=(num_days, num_assets)) * volatilities
+    daily_returns = np.clip(daily_returns, -0.5, None)
+    prices = random_state.uniform(10, 500, num_assets) \
+        * np.cumprod(1 + daily_returns, axis=0)
+
+    market_caps = random_state.lognormal(24, 1.2, num_assets)
+    weights = market_caps / np.sum(market_caps)
+    index_prices = 7000 * np.cumprod(1 + daily_returns.dot(weights))
+
+    if (missing in ('listings', 'mixed')):
+        late = random_state.rand(num_assets) < 0.2
+        starts = random_state.randint(1, max(num_days // 2, 2), num_assets)
+        for column in np.flatnonzero(late):
+            prices[:starts[column], column] = np.nan
+    if (missing in ('gaps', 'mixed')):
+        for column in np.flatnonzero(random_state.rand(num_assets) < 0.1):
+            for _ in range(random_state.randint(1, 4)):
+                start = random_state.randint(num_days)
+                prices[start:start + random_state.randint(1, 10), column] = np.nan
+    if (missing in ('delistings', 'mixed')):
+        delisted = random_state.rand(num_assets) < 0.05
+        ends = random_state.randint(num_days // 2, num_days, num_assets)
+        for column in np.flatnonzero(delisted):
+            prices[ends[column]:, column] = np.nan
+
+    return SyntheticMarket(
+        pd.DataFrame(prices, index=index, columns=tickers),
+        pd.DataFrame(index_prices, index=index, columns=['^NDX']),
+        dict(zip(tickers, market_caps)))
+
+def generate_views(tickers, num_views, seed=0):
+    """
+    - random black-litterman views in the create_views_and_link_matrix
+      format, half relative and half absolute
+    """
+    random_state = np.random.RandomState(seed)
+    views = []
+    for i in range(num_views):
+        first, second = random_state.choice(len(tickers), 2, replace=False)
+        if (i % 2 == 0):
+            views.append((tickers[first], '>', tickers[second],
+                          round(random_state.uniform(0.01, 0.1), 4)))
+        else:
+            views.append((tickers[first], '=',
+                          round(random_state.uniform(0.05, 0.4), 4)))
+    return views
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import pandas as pd
 import matplotlib
@@ -48,8 +49,9 @@ def test(tickers):
     daily_returns = df.pct_change()
     mean_returns = daily_returns.mean()
     cov_matrix = daily_returns.cov()
-    # num_portfolios = 5000000
-    num_portfolios = 30000
+    # drawn from a histogram of the simulated portfolios, so memory does
+    # not grow with num_portfolios
+    num_portfolios = 5000000
     risk_free_rate = 0.0178
 
     # display_efficient_frontier(mean_returns, cov_matrix,
@@ -58,7 +60,8 @@ def test(tickers):
     # plt.savefig('efficient_frontier', dpi=450)
 
     display_calculated_ef_with_random(None, mean_returns, cov_matrix,
-                                      num_portfolios, risk_free_rate)
+                                      num_portfolios, risk_free_rate,
+                                      num_workers=os.cpu_count())
     plt.savefig('efficient_frontier_2', dpi=450)
 
     # test_portfolio_performance(df, mean_returns_function,
@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+class LRUCache:
+    """
+    - bounded, thread-safe key-value cache
+    - the least recently used entry is evicted when maxsize is reached
+    - each entry may have an expiry time (UTC datetime), after which it is
+      treated as missing
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if (item is not None and item[1] is not None \
+                and item[1] <= datetime.utcnow()):
+                del self._items[key]
+                item = None
+            if (item is None):
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, expires_at=None):
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_compute(self, key, compute, expires_at=None):
+        missing = object()
+        value = self.get(key, missing)
+        if (value is missing):
+            value = compute()
+            self.set(key, value, expires_at)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._items),
+                'maxsize': self.maxsize
+            }
@@ -1,4 +1,49 @@
+import os
 from pathlib import Path
 
 ROOT = (Path(__file__) / '..').resolve()
-CACHED_DATA_FOLDER = ROOT / 'cached_data'
\ No newline at end of file
+CACHED_DATA_FOLDER = ROOT / 'cached_data'
+# one file of daily prices per ticker
+PRICE_STORE_FOLDER = CACHED_DATA_FOLDER / 'tickers'
+
+# (hour, minute) in UTC, after the NASDAQ close
+PRICE_REFRESH_TIME = (21, 30)
+
+# valid values of `years` in /get_optimal_portfolio, their statistics are
+# precomputed on every data refresh
+VALID_YEARS = range(1, 10)
+
+# number of /get_optimal_portfolio results and anchor points kept in memory
+RESULT_CACHE_SIZE = 1024
+ANCHOR_CACHE_SIZE = 256
+# covariance matrices of the non-sample estimators, per window
+COVARIANCE_CACHE_SIZE = 64
+
+# largest number of requests in one /get_optimal_portfolios call
+PORTFOLIO_BATCH_MAX_REQUESTS = 100
+
+# /efficient_frontier: number of results kept in memory, default and
+# largest number of points on the curve
+FRONTIER_CACHE_SIZE = 64
+FRONTIER_POINTS = 50
+FRONTIER_MAX_POINTS = 1000
+
+# price downloads: tickers per request, concurrent requests, retries with
+# exponential backoff (seconds) and a global limit in requests per second
+FETCH_BATCH_SIZE = 20
+FETCH_MAX_WORKERS = 8
+FETCH_MAX_RETRIES = 3
+FETCH_BACKOFF = 1.
+FETCH_RATE_LIMIT = 2.
+
+# 'inline' runs optimizations in the request thread, 'pool' on a pool of
+# worker processes that each hold the price data; deadline in seconds,
+# requests beyond max pending jobs are answered with 503
+SERVING_MODE = os.environ.get('SERVING_MODE', 'inline')
+SERVING_WORKERS = int(os.environ.get('SERVING_WORKERS', os.cpu_count() or 1))
+SERVING_MAX_PENDING = int(os.environ.get('SERVING_MAX_PENDING',
+                                         4 * SERVING_WORKERS))
+SERVING_TIMEOUT = float(os.environ.get('SERVING_TIMEOUT', 10.))
+
+# add a Server-Timing header with the time of each stage to responses
+METRICS_TIMING_HEADER = os.environ.get('METRICS_TIMING_HEADER', '') == '1'
\ No newline at end of file
@@ -0,0 +1,98 @@
+import base64
+import json
+import struct
+
+import numpy as np
+
+# dense numeric arrays in a response are sent as little-endian float32
+ARRAY_DTYPE = '<f4'
+
+def map_arrays(value, function):
+    """
+    - copy of nested dicts / lists / tuples with every np.ndarray replaced
+      by function(array)
+    """
+    if (isinstance(value, np.ndarray)):
+        return function(value)
+    if (isinstance(value, dict)):
+        return {key: map_arrays(item, function) for key, item in value.items()}
+    if (isinstance(value, (list, tuple))):
+        return [map_arrays(item, function) for item in value]
+    return value
+
+def to_json_lists(value):
+    """
+    - every array becomes nested lists, non-finite numbers (e.g. the
+      infinite lambda of the first corner portfolio) become None, since
+      JSON has no Infinity or NaN
+    """
+    def encode(array):
+        if (not np.issubdtype(array.dtype, np.floating) \
+            or np.all(np.isfinite(array))):
+            return array.tolist()
+        return np.where(np.isfinite(array), array.astype(object), None) \
+            .tolist()
+    return map_arrays(value, encode)
+
+def to_base64_arrays(value):
+    """
+    - every array becomes {'dtype': '<f4', 'shape': [...], 'data': <base64>},
+      e.g. in javascript new Float32Array(bytes.buffer) reads the data
+    """
+    def encode(array):
+        data = np.ascontiguousarray(array, dtype=ARRAY_DTYPE)
+        return {
+            'dtype': ARRAY_DTYPE,
+            'shape': list(data.shape),
+            'data': base64.b64encode(data.tobytes()).decode('ascii')
+        }
+    return map_arrays(value, encode)
+
+def to_binary(value):
+    """
+    - one buffer: <uint32 little-endian header length> <json header>
+      <padding to 4 bytes> <array data>
+    - the header is value with every array replaced by
+      {'dtype': '<f4', 'shape': [...], 'offset': <bytes from data start>}
+    """
+    buffers = []
+    offset = [0]
+
+    def encode(array):
+        data = np.ascontiguousarray(array, dtype=ARRAY_DTYPE)
+        description = {
+            'dtype': ARRAY_DTYPE,
+            'shape': list(data.shape),
+            'offset': offset[0]
+        }
+        buffers.append(data.tobytes())
+        offset[0] += data.nbytes
+        return description
+
+    header = json.dumps(map_arrays(value, encode), allow_nan=False) \
+        .encode('utf-8')
+    # keep the array data aligned for zero-copy float32 views
+    padding = b' ' * (-(4 + len(header)) % 4)
+    return struct.pack('<I', len(header) + len(padding)) + header + padding \
+        + b''.join(buffers)
+
+def from_binary(buffer):
+    """
+    - inverse of to_binary, arrays are read-only views of buffer
+    """
+    header_length = struct.unpack('<I', buffer[:4])[0]
+    header = json.loads(buffer[4:4 + header_length].decode('utf-8'))
+    data_start = 4 + header_length
+
+    def decode(value):
+        if (isinstance(value, dict)):
+            if (set(value) == {'dtype', 'shape', 'offset'}):
+                count = int(np.prod(value['shape']))
+                return np.frombuffer(buffer, dtype=value['dtype'],
+                    count=count, offset=data_start + value['offset']) \
+                    .reshape(value['shape'])
+            return {key: decode(item) for key, item in value.items()}
+        if (isinstance(value, list)):
+            return [decode(item) for item in value]
+        return value
+    return decode(header)
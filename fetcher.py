@@ -0,0 +1,88 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    FETCH_BACKOFF,
+    FETCH_BATCH_SIZE,
+    FETCH_MAX_RETRIES,
+    FETCH_MAX_WORKERS,
+    FETCH_RATE_LIMIT
+)
+
+class RateLimiter:
+    """
+    - token bucket shared by every fetching thread
+    - rate = requests per second, burst = how many may start at once
+    """
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.burst,
+                    self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if (self._tokens >= 1):
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+rate_limiter = RateLimiter(FETCH_RATE_LIMIT)
+
+def split_into_batches(tickers, batch_size=FETCH_BATCH_SIZE):
+    return [tickers[i:i + batch_size] for i in range(0, len(tickers), batch_size)]
+
+def fetch_with_retry(transport, tickers, start_date, end_date,
+                     max_retries=FETCH_MAX_RETRIES, backoff=FETCH_BACKOFF,
+                     limiter=rate_limiter, sleep=time.sleep):
+    """
+    - call transport(tickers, start_date, end_date), retrying with
+      exponential backoff
+    - return (data, None) or (None, last exception)
+    """
+    error = None
+    for attempt in range(max_retries + 1):
+        if (attempt > 0):
+            sleep(backoff * 2 ** (attempt - 1))
+        if (limiter is not None):
+            limiter.acquire()
+        try:
+            return transport(tickers, start_date, end_date), None
+        except Exception as e:
+            error = e
+    return None, error
+
+def fetch_batches(transport, requests, max_workers=FETCH_MAX_WORKERS,
+                  max_retries=FETCH_MAX_RETRIES, backoff=FETCH_BACKOFF,
+                  limiter=rate_limiter, sleep=time.sleep):
+    """
+    - requests = [(tickers, start_date, end_date), ...]
+    - run every request concurrently on a bounded thread pool, so a slow
+      or failing batch only delays itself
+    - return [(data, error), ...] in the order of requests, where exactly
+      one of data and error is None
+    """
+    if (not requests):
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(requests))) as pool:
+        futures = [pool.submit(fetch_with_retry, transport, tickers,
+                               start_date, end_date, max_retries, backoff,
+                               limiter, sleep)
+                   for tickers, start_date, end_date in requests]
+        results = [future.result() for future in futures]
+    for (tickers, _, _), (_, error) in zip(requests, results):
+        if (error is not None):
+            print('failed to fetch', tickers)
+            traceback.print_exception(type(error), error, error.__traceback__)
+    return results
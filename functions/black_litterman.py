@@ -0,0 +1,182 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import scipy.linalg as scl
+import scipy.sparse as sps
+
+from cache import (
+    LRUCache
+)
+
+from .portfolio import (
+    portfolio_return,
+    portfolio_variance
+)
+
+TAU = .025
+
+def fingerprint(array):
+    """
+    - short key of an array's shape and contents, for caching by value
+    """
+    array = np.ascontiguousarray(np.asarray(array, dtype=float))
+    return array.shape, hashlib.sha1(array.tobytes()).hexdigest()
+
+VIEW_COLUMNS = ['ticker', 'operator', 'relative_ticker', 'value']
+
+# ticker -> column lookups by universe, the hash table of a pd.Index is
+# built on its first lookup and reused afterwards
+ticker_index_cache = LRUCache(maxsize=32)
+
+def get_ticker_index(names):
+    names = tuple(names)
+    return ticker_index_cache.get_or_compute(names, lambda: pd.Index(names))
+
+def views_to_table(views):
+    """
+    - columnar view table from views in the create_views_and_link_matrix
+      format
+    """
+    table = {column: [] for column in VIEW_COLUMNS}
+    for view in views:
+        if (view[1] == '<' or view[1] == '>'):
+            row = (view[0], view[1], view[2], view[3])
+        elif (view[1] == '='):
+            row = (view[0], view[1], None, view[2])
+        else:
+            raise ValueError('incorrect view format')
+        for column, value in zip(VIEW_COLUMNS, row):
+            table[column].append(value)
+    return table
+
+def compile_views(names, view_table):
+    """
+    - (Q, P) of create_views_and_link_matrix for a whole view table at
+      once, P = <scipy.sparse.csr_matrix> with one or two entries per view
+    - view_table = <pd.DataFrame> or {column: values} with columns
+        ticker          view on this ticker
+        operator        '>' or '<' (relative view), '=' (absolute view)
+        relative_ticker other ticker of a relative view, ignored otherwise
+        value           annualized return (difference)
+    """
+    index = get_ticker_index(names)
+    operators = np.asarray(view_table['operator'], dtype=object)
+    num_views = len(operators)
+    is_greater = operators == '>'
+    is_relative = is_greater | (operators == '<')
+    if (not np.all(is_relative | (operators == '='))):
+        raise ValueError('incorrect view format')
+
+    columns = index.get_indexer(np.asarray(view_table['ticker'], dtype=object))
+    relative_tickers = np.asarray(view_table['relative_ticker'], dtype=object)
+    relative_columns = np.full(num_views, -1)
+    relative_columns[is_relative] = index.get_indexer(
+        relative_tickers[is_relative])
+    if (np.any(columns < 0) or np.any(relative_columns[is_relative] < 0)):
+        unknown = set(np.asarray(view_table['ticker'], dtype=object)[columns < 0]) \
+            | set(relative_tickers[is_relative & (relative_columns < 0)])
+        raise KeyError('unknown tickers in views: %s' % sorted(map(str, unknown)))
+
+    Q = np.asarray(view_table['value'], dtype=float) / 252
+    sign = np.where(is_relative & ~is_greater, -1., 1.)
+    rows = np.concatenate([np.arange(num_views), np.flatnonzero(is_relative)])
+    data = np.concatenate([sign, -sign[is_relative]])
+    P = sps.csr_matrix(
+        (data, (rows, np.concatenate([columns, relative_columns[is_relative]]))),
+        shape=(num_views, len(index)))
+    return Q, P
+
+def get_view_table(views):
+    """
+    - views as a view table, either already one or a collection of views
+      in the create_views_and_link_matrix format
+    """
+    if (isinstance(views, (dict, pd.DataFrame))):
+        return views
+    return views_to_table(views)
+
+def _as_pick_matrix(P):
+    if (sps.issparse(P)):
+        return sps.csr_matrix(P, dtype=float)
+    return np.atleast_2d(np.asarray(P, dtype=float))
+
+def _solve_symmetric(matrix, rhs):
+    try:
+        return scl.cho_solve(scl.cho_factor(matrix), rhs)
+    except np.linalg.LinAlgError:
+        # e.g. the same view given twice
+        return np.linalg.lstsq(matrix, rhs, rcond=None)[0]
+
+class BlackLittermanPrior:
+    """
+    - equilibrium returns pi and covariance of one market, reused for any
+      number of view sets
+    - the posterior is computed in the form
+          pi + tau S P' (P tau S P' + omega)^-1 (Q - P pi)
+      which only solves one (views x views) system, instead of inverting
+      tau S and omega (assets x assets)
+    - omega defaults to tau P S P', as in equilibriumExcessReturnsAdjustedViews
+    - P may be a scipy.sparse matrix, e.g. from compile_views
+    """
+    def __init__(self, pi, cov_matrix, tau=TAU):
+        self.pi = np.asarray(pi, dtype=float)
+        self.cov_matrix = np.asarray(cov_matrix, dtype=float)
+        self.tau = tau
+
+    def posterior(self, Q, P, omega=None):
+        return self.posteriors([(Q, P, omega)])[0]
+
+    def posteriors(self, scenarios):
+        """
+        - scenarios = [(Q, P), (Q, P, omega), ...] view sets of
+          create_views_and_link_matrix
+        - return <np.ndarray> one row of posterior returns per scenario
+        """
+        scenarios = [tuple(scenario) + (None,) * (3 - len(scenario))
+                     for scenario in scenarios]
+        if (not scenarios):
+            return np.zeros((0, len(self.pi)))
+        # one product with the covariance for the views of every scenario,
+        # (P S)' = S P' since S is symmetric
+        pick_matrices = [_as_pick_matrix(P) for _, P, _ in scenarios]
+        if (any(sps.issparse(P) for P in pick_matrices)):
+            P_all = sps.vstack(pick_matrices, format='csr')
+        else:
+            P_all = np.vstack(pick_matrices)
+        tau_cov_pt = self.tau * np.asarray(P_all.dot(self.cov_matrix)).T
+
+        result = np.empty((len(scenarios), len(self.pi)))
+        first = 0
+        for index, (Q, _, omega) in enumerate(scenarios):
+            num_views = pick_matrices[index].shape[0]
+            P = P_all[first:first + num_views]
+            tau_cov_pt_scenario = tau_cov_pt[:, first:first + num_views]
+            first += num_views
+            view_cov = np.asarray(P.dot(tau_cov_pt_scenario))
+            if (omega is None):
+                omega = view_cov
+            surprise = np.asarray(Q, dtype=float) - P.dot(self.pi)
+            result[index] = self.pi + tau_cov_pt_scenario.dot(
+                _solve_symmetric(view_cov + omega, surprise))
+        return result
+
+def equilibrium_excess_returns(market_cap, returns, cov_matrix, risk_free_rate):
+    weights = market_cap / np.sum(market_cap)
+    port_return = portfolio_return(weights, returns, cov_matrix)
+    port_var = portfolio_variance(weights, returns, cov_matrix)
+    risk_aversion = (port_return - risk_free_rate) / port_var
+    return risk_aversion * np.asarray(cov_matrix, dtype=float).dot(weights)
+
+# priors by (covariance, returns, market cap, risk free rate, tau), so a
+# view sweep over one window computes the prior once
+prior_cache = LRUCache(maxsize=32)
+
+def get_black_litterman_prior(market_cap, returns, cov_matrix, risk_free_rate,
+                              tau=TAU):
+    market_cap = np.asarray(market_cap, dtype=float)
+    key = (fingerprint(cov_matrix), fingerprint(returns),
+           fingerprint(market_cap), risk_free_rate, tau)
+    return prior_cache.get_or_compute(key, lambda: BlackLittermanPrior(
+        equilibrium_excess_returns(
+            market_cap, returns, cov_matrix, risk_free_rate),
+        cov_matrix, tau))
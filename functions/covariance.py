@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+import scipy.linalg as scl
+import scipy.sparse.linalg as spl
+
+# half-life in trading days of the 'ewma' estimator
+EWMA_HALFLIFE = 63
+
+# statistical factors of the 'factor' estimator
+FACTOR_COUNT = 10
+
+class FactorCovariance:
+    """
+    - covariance B B' + diag(d) of a factor model, stored as the
+      (assets x factors) loadings B and the specific variances d, so
+      memory and products with it are linear in the number of assets
+    - accepted in place of a dense cov_matrix by functions.portfolio and
+      functions.quadratic_programming; np.asarray gives the dense matrix
+      for code that needs one (e.g. the critical line algorithm)
+    - index = tickers of the rows, if known
+    """
+    def __init__(self, loadings, specific_variances, index=None):
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.specific_variances = np.asarray(specific_variances, dtype=float)
+        self.index = index
+
+    @property
+    def shape(self):
+        return (len(self.specific_variances),) * 2
+
+    def _scale(self, vector, x):
+        return vector[:, np.newaxis] * x if x.ndim == 2 else vector * x
+
+    def dot(self, x):
+        x = np.asarray(x, dtype=float)
+        return self.loadings.dot(self.loadings.T.dot(x)) \
+            + self._scale(self.specific_variances, x)
+
+    def diagonal(self):
+        return np.sum(self.loadings ** 2, axis=1) + self.specific_variances
+
+    def take(self, positions):
+        """
+        - factor covariance of a subset of the assets, by position
+        """
+        return FactorCovariance(self.loadings[positions],
+            self.specific_variances[positions],
+            None if self.index is None else self.index[positions])
+
+    def solve(self, rhs):
+        """
+        - cov^-1 rhs by the Woodbury identity
+              (D + B B')^-1 = D^-1 - D^-1 B (I + B' D^-1 B)^-1 B' D^-1
+          which only factorizes a (factors x factors) matrix
+        """
+        if (not np.all(self.specific_variances > 0)):
+            raise np.linalg.LinAlgError('specific variances must be positive')
+        inverse = 1. / self.specific_variances
+        scaled_loadings = self.loadings * inverse[:, np.newaxis]
+        capacitance = np.eye(self.loadings.shape[1]) \
+            + self.loadings.T.dot(scaled_loadings)
+        scaled_rhs = self._scale(inverse, np.asarray(rhs, dtype=float))
+        return scaled_rhs - scaled_loadings.dot(scl.cho_solve(
+            scl.cho_factor(capacitance), self.loadings.T.dot(scaled_rhs)))
+
+    def toarray(self):
+        cov_matrix = self.loadings.dot(self.loadings.T)
+        cov_matrix[np.diag_indices_from(cov_matrix)] += self.specific_variances
+        return cov_matrix
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+def covariance_dot(cov_matrix, x):
+    if (isinstance(cov_matrix, FactorCovariance)):
+        return cov_matrix.dot(x)
+    return np.dot(cov_matrix, x)
+
+def covariance_diagonal(cov_matrix):
+    if (isinstance(cov_matrix, FactorCovariance)):
+        return cov_matrix.diagonal()
+    return np.diag(np.asarray(cov_matrix, dtype=float))
+
+def solve_covariance(cov_matrix, rhs):
+    """
+    - cov_matrix^-1 rhs, raises np.linalg.LinAlgError when cov_matrix is
+      not positive definite
+    """
+    if (isinstance(cov_matrix, FactorCovariance)):
+        return cov_matrix.solve(rhs)
+    return scl.cho_solve(
+        scl.cho_factor(np.asarray(cov_matrix, dtype=float)), rhs)
+
+def _complete_rows(returns):
+    return returns[~np.isnan(returns).any(axis=1)]
+
+def sample_covariance(returns):
+    return np.cov(returns, rowvar=False)
+
+def _centered(returns):
+    """
+    - (centered returns, maximum likelihood covariance, number of days),
+      the shrinkage intensities are estimated from these
+    """
+    num_days = len(returns)
+    x = returns - returns.mean(axis=0)
+    s = x.T.dot(x) / num_days
+    return x, s, num_days
+
+def ledoit_wolf_covariance(returns):
+    """
+    - Ledoit & Wolf (2004): sample covariance shrunk toward a multiple of
+      the identity, with the intensity that minimizes the expected
+      squared error
+    """
+    x, s, num_days = _centered(returns)
+    num_assets = s.shape[0]
+    mu = np.trace(s) / num_assets
+    target = mu * np.eye(num_assets)
+    delta = np.sum((s - target) ** 2) / num_assets
+    squared = x ** 2
+    beta = (np.sum(squared.T.dot(squared)) / num_days - np.sum(s ** 2)) \
+        / (num_assets * num_days)
+    shrinkage = min(beta, delta) / delta if delta > 0 else 0.
+    cov_matrix = sample_covariance(returns)
+    return (1 - shrinkage) * cov_matrix \
+        + shrinkage * np.trace(cov_matrix) / num_assets * np.eye(num_assets)
+
+def constant_correlation_covariance(returns):
+    """
+    - Ledoit & Wolf (2003): sample covariance shrunk toward the matrix
+      with the sample variances and one average correlation
+    """
+    x, s, num_days = _centered(returns)
+    variances = np.diag(s)
+    stds = np.sqrt(variances)
+    num_assets = s.shape[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = s / np.outer(stds, stds)
+    off_diagonal = ~np.eye(num_assets, dtype=bool)
+    mean_correlation = np.nanmean(correlation[off_diagonal]) \
+        if num_assets > 1 else 0.
+    target = mean_correlation * np.outer(stds, stds)
+    np.fill_diagonal(target, variances)
+
+    # pi = sum of asymptotic variances of the sample covariance entries,
+    # rho = their covariances with the target, gamma = misspecification
+    squared = x ** 2
+    pi_matrix = squared.T.dot(squared) / num_days - s ** 2
+    theta = (x ** 3).T.dot(x) / num_days - variances[:, np.newaxis] * s
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.sqrt(variances[np.newaxis, :] / variances[:, np.newaxis])
+    rho = np.trace(pi_matrix) + mean_correlation \
+        * np.nansum((ratio * theta)[off_diagonal])
+    gamma = np.sum((target - s) ** 2)
+    shrinkage = 0.
+    if (gamma > 0):
+        shrinkage = max(0., min(1., (np.sum(pi_matrix) - rho) / gamma / num_days))
+
+    cov_matrix = sample_covariance(returns)
+    sample_stds = np.sqrt(np.diag(cov_matrix))
+    sample_target = mean_correlation * np.outer(sample_stds, sample_stds)
+    np.fill_diagonal(sample_target, np.diag(cov_matrix))
+    return (1 - shrinkage) * cov_matrix + shrinkage * sample_target
+
+def ewma_covariance(returns, halflife=EWMA_HALFLIFE):
+    """
+    - exponentially weighted covariance, the weight of a day halves every
+      halflife days back from the last one
+    """
+    num_days = len(returns)
+    weights = 0.5 ** (np.arange(num_days)[::-1] / float(halflife))
+    weights /= np.sum(weights)
+    x = returns - weights.dot(returns)
+    # unbiased for the weights, like ddof=1 for equal weights
+    return (x * weights[:, np.newaxis]).T.dot(x) / (1 - np.sum(weights ** 2))
+
+def factor_covariance(returns, num_factors=FACTOR_COUNT):
+    """
+    - FactorCovariance of the num_factors principal components of the
+      returns, from a truncated SVD of the centered returns, so the
+      (assets x assets) sample covariance is never formed
+    - specific variances are what the factors leave of each sample
+      variance, kept above a small floor so the model is positive definite
+    """
+    num_days, num_assets = returns.shape
+    x = returns - returns.mean(axis=0)
+    num_factors = max(min(num_factors, num_days - 1, num_assets), 0)
+    if (0 < num_factors < min(num_days, num_assets) - 1):
+        _, singular_values, vt = spl.svds(x, k=num_factors,
+            v0=np.ones(min(num_days, num_assets)))
+    else:
+        _, singular_values, vt = np.linalg.svd(x, full_matrices=False)
+    order = np.argsort(singular_values)[::-1][:num_factors]
+    loadings = vt[order].T * singular_values[order] / np.sqrt(num_days - 1)
+    variances = np.sum(x ** 2, axis=0) / (num_days - 1)
+    floor = 1e-4 * variances + np.finfo(float).eps * max(np.mean(variances), 1.)
+    return FactorCovariance(loadings, np.maximum(
+        variances - np.sum(loadings ** 2, axis=1), floor))
+
+COVARIANCE_ESTIMATORS = {
+    'sample': sample_covariance,
+    'ledoit_wolf': ledoit_wolf_covariance,
+    'constant_correlation': constant_correlation_covariance,
+    'ewma': ewma_covariance,
+    'factor': factor_covariance
+}
+
+def get_covariance_estimator(name):
+    if (name not in COVARIANCE_ESTIMATORS):
+        raise ValueError('covariance must be one of %s'
+                         % sorted(COVARIANCE_ESTIMATORS))
+    return COVARIANCE_ESTIMATORS[name]
+
+def estimate_covariance(daily_returns, estimator='sample', **kwargs):
+    """
+    - covariance matrix of daily returns (rows = days) with the named
+      estimator, a dataframe for a dataframe and an array for an array
+    - 'sample' of a dataframe is daily_returns.cov(), which uses pairwise
+      complete days; the other estimators use the days without missing
+      values
+    - 'factor' returns a FactorCovariance, indexed by the columns of a
+      dataframe
+    """
+    estimate = get_covariance_estimator(estimator)
+    if (isinstance(daily_returns, pd.DataFrame)):
+        returns = np.asarray(daily_returns.values, dtype=float)
+        missing = np.isnan(returns)
+        if (estimator == 'sample' and missing.any(axis=1).sum() \
+                != missing.all(axis=1).sum()):
+            return daily_returns.cov()
+        # without partly missing days (e.g. only the first day of
+        # pct_change is missing) pairwise and complete days are the same
+        cov_matrix = estimate(_complete_rows(returns), **kwargs)
+        if (isinstance(cov_matrix, FactorCovariance)):
+            cov_matrix.index = daily_returns.columns
+            return cov_matrix
+        return pd.DataFrame(cov_matrix, index=daily_returns.columns,
+                            columns=daily_returns.columns)
+    returns = np.asarray(daily_returns, dtype=float)
+    return estimate(_complete_rows(returns), **kwargs)
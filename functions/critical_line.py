@@ -0,0 +1,271 @@
+import numpy as np
+
+from .portfolio import (
+    portfolio_return,
+    portfolio_standard_deviation
+)
+
+from .quadratic_programming import (
+    solve_long_only_qp
+)
+
+
+def _is_degenerate(c, first, second):
+    # c = second - first vanishes up to round-off, e.g. when every free
+    # asset has the same expected return
+    with np.errstate(invalid='ignore'):
+        return ~(np.abs(c) > 1e-10 * (np.abs(first) + np.abs(second)))
+
+def _free_to_bound_lambdas(cov_free_inv, mean_free, bounded_term, bounded_sum,
+                           lower_free, upper_free):
+    """
+    - case a) for every free asset, the lambda at which its weight reaches
+      a bound and that bound, nan where its weight does not move with lambda
+    - bounded_term = cov[free, bounded] weights[bounded]; c1 .. c4 and
+      l1 .. l3 are shared by all free assets, so they are computed once
+    """
+    c4 = cov_free_inv.sum(axis=1)
+    c2 = cov_free_inv.dot(mean_free)
+    c1 = np.sum(c4)
+    c3 = c4.dot(mean_free)
+    l3 = cov_free_inv.dot(bounded_term)
+    l2 = np.sum(l3)
+    c = - c1 * c2 + c3 * c4
+    bound = np.where(c > 0, upper_free, lower_free)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lambdas = ((1 - bounded_sum + l2) * c4 - c1 * (bound + l3)) / c
+    lambdas[_is_degenerate(c, c1 * c2, c3 * c4)] = np.nan
+    return lambdas, bound
+
+def _bound_to_free_lambdas(cov, cov_free_inv, free, bounded, mean, weights,
+                           bounded_term):
+    """
+    - case b) for every bounded asset i, the lambda at which it becomes
+      free, nan where there is none
+    - the inverse of the free block with i added is the bordered inverse
+          [[A^-1 + u u' / s, - u / s], [- u' / s, 1 / s]],
+          u = A^-1 cov[free, i], s = cov[i, i] - cov[free, i]' u
+      so c1 .. c4 and l1 .. l3 of every candidate follow from A^-1 and
+      the columns cov[free, bounded] at once
+    - bounded_term = cov[:, bounded] weights[bounded], for all assets
+    """
+    mean_free = mean[free]
+    columns = cov[np.ix_(free, bounded)]
+    u = cov_free_inv.dot(columns)
+    u_columns = np.sum(columns * u, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        schur = 1. / (cov[bounded, bounded] - u_columns)
+    inverse_ones = cov_free_inv.sum(axis=1)
+    ones_u = u.sum(axis=0) - 1
+    u_mean = u.T.dot(mean_free) - mean[bounded]
+
+    c1 = np.sum(inverse_ones) + ones_u ** 2 * schur
+    c3 = inverse_ones.dot(mean_free) + ones_u * u_mean * schur
+    c2 = - u_mean * schur
+    c4 = - ones_u * schur
+
+    # bounded term without asset i, which becomes free
+    bounded_weights = weights[bounded]
+    term_free = bounded_term[free]
+    term_i = bounded_term[bounded] - cov[bounded, bounded] * bounded_weights
+    u_term = u.T.dot(term_free) - bounded_weights * u_columns - term_i
+    l1 = np.sum(bounded_weights) - bounded_weights
+    l2 = inverse_ones.dot(term_free) - bounded_weights * (ones_u + 1) \
+        + ones_u * u_term * schur
+    l3 = - u_term * schur
+
+    c = - c1 * c2 + c3 * c4
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lambdas = ((1 - l1 + l2) * c4 - c1 * (bounded_weights + l3)) / c
+    lambdas[_is_degenerate(c, c1 * c2, c3 * c4) | ~np.isfinite(schur)] = np.nan
+    return lambdas
+
+def _compute_weights(cov_free_inv, mean_free, bounded_term, bounded_sum,
+                     lambda_value):
+    w1 = cov_free_inv.dot(bounded_term)
+    w2 = cov_free_inv.sum(axis=1)
+    w3 = cov_free_inv.dot(mean_free)
+    gamma = (- lambda_value * np.sum(w3) + 1 - bounded_sum + np.sum(w1)) \
+        / np.sum(w2)
+    return - w1 + gamma * w2 + lambda_value * w3
+
+def _add_to_inverse(inverse, column, corner):
+    # inverse of [[A, column], [column', corner]] from the inverse of A
+    u = inverse.dot(column)
+    schur = corner - column.dot(u)
+    size = len(column) + 1
+    result = np.empty((size, size))
+    result[:-1, :-1] = inverse + np.outer(u, u) / schur
+    result[:-1, -1] = - u / schur
+    result[-1, :-1] = - u / schur
+    result[-1, -1] = 1. / schur
+    return result
+
+def _remove_from_inverse(inverse, index):
+    # inverse of A without row and column index, from the inverse of A
+    keep = np.arange(len(inverse)) != index
+    column = inverse[keep, index]
+    return inverse[np.ix_(keep, keep)] - np.outer(column, column) \
+        / inverse[index, index]
+
+def _starting_corner(mean, cov_matrix, lower):
+    """
+    - (free assets, weights) of the maximum return corner: everything in
+      the highest return asset or, when several assets share the highest
+      return, their long-only minimum variance mix, which has the same
+      return and a lower variance than any other mix of them
+    """
+    top = np.flatnonzero(mean == np.max(mean))
+    weights = np.copy(lower)
+    if (len(top) == 1):
+        weights[top[0]] = 1.
+        return [int(top[0])], weights
+    result = solve_long_only_qp(cov_matrix[np.ix_(top, top)],
+        np.ones((1, len(top))), np.ones(1), np.full(len(top), 1. / len(top)))
+    weights[top] = result['x']
+    return [int(i) for i in top[result['x'] > 0]], weights
+
+def critical_line_algorithm(returns, cov_matrix, tol=1e-9):
+    """
+    - Markowitz's critical line algorithm for long-only, fully-invested
+      portfolios (0 <= weight <= 1)
+    - return the corner portfolios of the whole efficient frontier, from
+      the maximum return point down to the minimum standard deviation point
+        corners = {
+            'weights': <array num_corners x num_tickers>,
+            'lambdas': <array num_corners>,
+            'returns': <array num_corners>, # annualized
+            'stds': <array num_corners>     # annualized
+        }
+    - the frontier is linear in weights between two adjacent corners,
+      see frontier_weights
+    """
+    mean = np.asarray(returns, dtype=float)
+    cov = np.asarray(cov_matrix, dtype=float)
+    num_tickers = len(mean)
+    lower = np.zeros(num_tickers)
+    upper = np.ones(num_tickers)
+
+    free, weights = _starting_corner(mean, cov, lower)
+    cov_f_inv = np.linalg.inv(cov[np.ix_(free, free)])
+
+    corner_weights = [np.copy(weights)]
+    lambdas = [None]
+    # the asset that changed side at the last corner must not change back
+    # at the same lambda because of round-off, or the algorithm cycles
+    last_changed = None
+    while True:
+        free_index = np.array(free)
+        bounded = np.setdiff1d(np.arange(num_tickers), free_index)
+        bounded_term = cov[:, bounded].dot(weights[bounded])
+        bounded_sum = np.sum(weights[bounded])
+
+        # case a) one free weight moves to its bound
+        lambda_in = None
+        if (len(free) > 1):
+            candidates, bounds = _free_to_bound_lambdas(cov_f_inv,
+                mean[free_index], bounded_term[free_index], bounded_sum,
+                lower[free_index], upper[free_index])
+            candidates[free_index == last_changed] = np.nan
+            if (not np.all(np.isnan(candidates))):
+                j = int(np.nanargmax(candidates))
+                lambda_in, i_in, bound_in = candidates[j], free[j], bounds[j]
+
+        # case b) one bounded weight becomes free
+        lambda_out = None
+        if (len(bounded) > 0):
+            candidates = _bound_to_free_lambdas(cov, cov_f_inv, free_index,
+                bounded, mean, weights, bounded_term)
+            candidates[bounded == last_changed] = np.nan
+            if (lambdas[-1] is not None):
+                with np.errstate(invalid='ignore'):
+                    candidates[~(candidates < lambdas[-1])] = np.nan
+            if (not np.all(np.isnan(candidates))):
+                j = int(np.nanargmax(candidates))
+                lambda_out, i_out = candidates[j], int(bounded[j])
+
+        if ((lambda_in is None or lambda_in < 0) and \
+            (lambda_out is None or lambda_out < 0)):
+            # minimum standard deviation point
+            lambdas.append(0)
+        else:
+            # the inverse of the free block is updated in O(free^2)
+            # instead of inverted again
+            if (lambda_out is None or \
+                (lambda_in is not None and lambda_in > lambda_out)):
+                lambdas.append(lambda_in)
+                cov_f_inv = _remove_from_inverse(cov_f_inv, free.index(i_in))
+                free.remove(i_in)
+                weights[i_in] = bound_in
+                last_changed = i_in
+            else:
+                lambdas.append(lambda_out)
+                cov_f_inv = _add_to_inverse(cov_f_inv,
+                    cov[free_index, i_out], cov[i_out, i_out])
+                free.append(i_out)
+                last_changed = i_out
+            free_index = np.array(free)
+            bounded = np.setdiff1d(np.arange(num_tickers), free_index)
+            bounded_term = cov[:, bounded].dot(weights[bounded])
+            bounded_sum = np.sum(weights[bounded])
+        mean_free = mean[free_index] if lambdas[-1] != 0 \
+            else np.zeros(len(free))
+        weights[free_index] = _compute_weights(cov_f_inv, mean_free,
+            bounded_term[free_index], bounded_sum, lambdas[-1])
+        corner_weights.append(np.copy(weights))
+        if (lambdas[-1] == 0):
+            break
+
+    corner_weights = np.array(corner_weights)
+    lambdas[0] = np.inf
+    lambdas = np.array(lambdas, dtype=float)
+
+    # purge numerical errors and corners that are not on the efficient part
+    valid = (np.abs(np.sum(corner_weights, axis=1) - 1) <= tol) \
+        & np.all(corner_weights >= lower - tol, axis=1) \
+        & np.all(corner_weights <= upper + tol, axis=1)
+    corner_weights, lambdas = corner_weights[valid], lambdas[valid]
+    corner_means = corner_weights.dot(mean)
+    later_best = np.maximum.accumulate(corner_means[::-1])[::-1]
+    # a corner equal to the next one up to round-off is kept
+    keep = corner_means >= later_best - tol * np.abs(later_best)
+    corner_weights, lambdas = corner_weights[keep], lambdas[keep]
+    corner_weights = np.clip(corner_weights, lower, upper)
+
+    return {
+        'weights': corner_weights,
+        'lambdas': lambdas,
+        'returns': np.array([portfolio_return(w, mean, cov)
+                             for w in corner_weights]),
+        'stds': np.array([portfolio_standard_deviation(w, mean, cov)
+                          for w in corner_weights])
+    }
+
+def frontier_weights(corners, target_returns):
+    """
+    - weights of the efficient portfolios with the given annualized
+      target returns, interpolated between adjacent corner portfolios
+    - targets outside the frontier get nan weights
+    """
+    target_returns = np.atleast_1d(np.asarray(target_returns, dtype=float))
+    # corner returns are decreasing, flip them for searchsorted
+    corner_returns = corners['returns'][::-1]
+    corner_weights = corners['weights'][::-1]
+    upper_index = np.searchsorted(corner_returns, target_returns)
+    upper_index = np.clip(upper_index, 1, max(len(corner_returns) - 1, 1))
+    lower_index = upper_index - 1
+    if (len(corner_returns) == 1):
+        upper_index = lower_index = np.zeros(len(target_returns), dtype=int)
+
+    span = corner_returns[upper_index] - corner_returns[lower_index]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(span > 0,
+            (target_returns - corner_returns[lower_index]) / span, 0.)
+    weights = corner_weights[lower_index] * (1 - share)[:, np.newaxis] \
+        + corner_weights[upper_index] * share[:, np.newaxis]
+
+    tol = 1e-8 * max(1., np.max(np.abs(corner_returns)))
+    outside = (target_returns < corner_returns[0] - tol) \
+        | (target_returns > corner_returns[-1] + tol)
+    weights[outside] = np.nan
+    return weights
@@ -8,29 +8,51 @@ import matplotlib.colors
 from .portfolio import (
     portfolio_return,
     portfolio_standard_deviation,
-    portfolio_sharpe_ratio,
     find_minimum_standard_deviation_point,
     find_maximum_sharpe_ratio_point,
-    find_maximum_return_point
+    find_maximum_return_point,
+    find_efficient_return
+)
+
+from .simulation import (
+    evaluate_portfolios,
+    random_weights,
+    simulate_random_portfolios
+)
+
+from .critical_line import (
+    critical_line_algorithm,
+    frontier_weights
 )
 
 def random_portfolios(num_portfolios, returns, cov_matrix, risk_free_rate):
-    results = np.zeros((3, num_portfolios))
-    weights_record = []
-    for i in range(num_portfolios):
-        weights = np.random.random(len(returns))
-        weights /= np.sum(weights)
-        weights_record.append(weights)
-
-        port_return = portfolio_return(weights, returns, cov_matrix)
-        port_std = portfolio_standard_deviation(weights, returns, cov_matrix)
-        port_sharpe = portfolio_sharpe_ratio(weights, returns, cov_matrix,
-                                             risk_free_rate)
-        results[0][i] = port_return
-        results[1][i] = port_std
-        results[2][i] = port_sharpe
+    # same draws as sampling one weight vector at a time, evaluated at once;
+    # use simulate_random_portfolios for large num_portfolios
+    weights = random_weights(num_portfolios, len(returns))
+    results = evaluate_portfolios(weights, returns, cov_matrix, risk_free_rate)
+    weights_record = list(weights)
     return results, weights_record
 
+def display_random_portfolios(counts, std_edges, return_edges,
+                              risk_free_rate, color_map):
+    """
+    - counts, std_edges, return_edges = simulate_random_portfolios output
+      with reduction='histogram'
+    - every cell holding a simulated portfolio is drawn in the color of the
+      sharpe ratio at its center, so millions of portfolios are drawn from
+      a fixed-size grid instead of one point each
+    """
+    std_centers = (std_edges[:-1] + std_edges[1:]) / 2
+    return_centers = (return_edges[:-1] + return_edges[1:]) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpes = (return_centers[:, np.newaxis] - risk_free_rate) \
+            / std_centers[np.newaxis, :]
+    plt.pcolormesh(std_edges, return_edges,
+        np.ma.masked_where(counts.T == 0, sharpes), cmap=color_map, alpha=0.3)
+
+def get_highest_simulated_return(counts, return_edges):
+    return return_edges[np.flatnonzero(np.sum(counts, axis=0))[-1] + 1]
+
 def efficient_return(returns, cov_matrix, target):
     num_tickers = len(returns)
     args = (returns, cov_matrix)
@@ -52,26 +74,54 @@ def efficient_return(returns, cov_matrix, target):
     return result
 
 
-def efficient_frontier(returns, cov_matrix, target_returns):
+def efficient_frontier(returns, cov_matrix, target_returns, method='SLSQP'):
+    if (method == 'critical_line'):
+        return critical_line_frontier(returns, cov_matrix, target_returns)
+    # neighboring targets have similar optimal weights, so every point
+    # starts from the solution of the previous one
     efficients = []
+    previous = {}
     for target_return in target_returns:
-        efficients.append(efficient_return(returns, cov_matrix, target_return))
+        result = find_efficient_return(returns, cov_matrix, target_return,
+                                       method=method, **previous)
+        if (result['success']):
+            previous = {
+                'initial_weights': result['x'],
+                'solver_state': result['solver_state']
+            }
+        efficients.append(result)
+    return efficients
+
+def critical_line_frontier(returns, cov_matrix, target_returns):
+    corners = critical_line_algorithm(returns, cov_matrix)
+    efficients = []
+    for weights in frontier_weights(corners, target_returns):
+        success = not np.isnan(weights).any()
+        efficients.append(sco.OptimizeResult(
+            x=weights,
+            fun=portfolio_standard_deviation(weights, returns, cov_matrix),
+            success=success, status=0 if success else 2,
+            message='Interpolated between corner portfolios' if success \
+                else 'Target return is not on the efficient frontier'))
     return efficients
 
 def display_efficient_frontier(returns, cov_matrix,
-                               num_portfolios, risk_free_rate, color, label):
-    results, _ = random_portfolios(
-        num_portfolios, returns, cov_matrix, risk_free_rate)
+                               num_portfolios, risk_free_rate, color, label,
+                               num_workers=1):
+    counts, _, return_edges = simulate_random_portfolios(
+        num_portfolios, returns, cov_matrix, risk_free_rate,
+        reduction='histogram', num_workers=num_workers)
 
     min_std_weight = find_minimum_standard_deviation_point(
-        returns, cov_matrix)['x']
+        returns, cov_matrix, method='active_set')['x']
     min_std_port_return = portfolio_return(min_std_weight, returns, cov_matrix)
     min_std_port_std = portfolio_standard_deviation(min_std_weight, returns, cov_matrix)
 
-    target_returns = np.linspace(min_std_port_return, np.max(results[0]), 50)
+    target_returns = np.linspace(min_std_port_return,
+        get_highest_simulated_return(counts, return_edges), 50)
     print('target returns', target_returns)
     efficient_portfolios = efficient_frontier(
-        returns, cov_matrix, target_returns)
+        returns, cov_matrix, target_returns, method='critical_line')
     plt.plot([p['fun'] for p in efficient_portfolios], target_returns,
         linestyle='-', color=color, linewidth=3, zorder=1,
         label=label)
@@ -104,9 +154,11 @@ def display_tangent_portfolio(returns, cov_matrix, risk_free_rate, columns,
 
 
 def display_calculated_ef_with_random(columns, returns, cov_matrix,
-                                      num_portfolios, risk_free_rate):
-    results, _ = random_portfolios(
-        num_portfolios, returns, cov_matrix, risk_free_rate)
+                                      num_portfolios, risk_free_rate,
+                                      num_workers=1):
+    counts, std_edges, return_edges = simulate_random_portfolios(
+        num_portfolios, returns, cov_matrix, risk_free_rate,
+        reduction='histogram', bins=200, num_workers=num_workers)
 
     max_sharpe_weight = find_maximum_sharpe_ratio_point(
         returns, cov_matrix, risk_free_rate)['x']
@@ -115,7 +167,7 @@ def display_calculated_ef_with_random(columns, returns, cov_matrix,
     # max_sharpe_allocation = get_allocation(columns, max_sharpe_weight)
 
     min_std_weight = find_minimum_standard_deviation_point(
-        returns, cov_matrix)['x']
+        returns, cov_matrix, method='active_set')['x']
     min_std_port_return = portfolio_return(min_std_weight, returns, cov_matrix)
     min_std_port_std = portfolio_standard_deviation(min_std_weight, returns, cov_matrix)
     # min_std_allocation = get_allocation(columns, min_std_weight)
@@ -141,8 +193,8 @@ def display_calculated_ef_with_random(columns, returns, cov_matrix,
     color_map = matplotlib.colors.LinearSegmentedColormap.from_list(
         '', ['#D1D1D1', '#60D68C', '#394EC4'])
     plt.figure(figsize=(10, 7))
-    plt.scatter(results[1,:], results[0,:], c=results[2,:],
-        cmap=color_map, marker='o', s=10, alpha=0.3)
+    display_random_portfolios(counts, std_edges, return_edges,
+                              risk_free_rate, color_map)
     plt.colorbar()
     plt.scatter(min_std_port_std, min_std_port_return,
         marker='o', color='#36A9D6', edgecolors='black', linewidth=3,
@@ -154,8 +206,10 @@ def display_calculated_ef_with_random(columns, returns, cov_matrix,
         marker='o', color='#E3F539', edgecolors='black', linewidth=3,
         s=225, zorder=2, label='Maximum Return')
 
-    target_returns = np.linspace(min_std_port_return, np.max(results[0]), 50)
-    efficient_portfolios = efficient_frontier(returns, cov_matrix, target_returns)
+    target_returns = np.linspace(min_std_port_return,
+        get_highest_simulated_return(counts, return_edges), 50)
+    efficient_portfolios = efficient_frontier(returns, cov_matrix, target_returns,
+        method='critical_line')
     plt.plot([p['fun'] for p in efficient_portfolios], target_returns,
         linestyle='-', color='black', linewidth=3, zorder=1,
         label='Efficient Frontier')
@@ -163,6 +217,6 @@ def display_calculated_ef_with_random(columns, returns, cov_matrix,
     plt.xlabel('Annualized Standard Deviation')
     plt.ylabel('Annualized Return')
     plt.legend(labelspacing=1.25, borderpad=1)
-    # plt.xlim([0, np.max(results[1])])
-    # plt.ylim([0, np.max(results[0])])
+    # plt.xlim([0, std_edges[-1]])
+    # plt.ylim([0, return_edges[-1]])
     # plt.show()
\ No newline at end of file
@@ -1,5 +1,19 @@
 import numpy as np
+import scipy.cluster.hierarchy as sch
 import scipy.optimize as sco
+import scipy.spatial.distance as ssd
+
+from .covariance import (
+    FactorCovariance,
+    covariance_diagonal,
+    covariance_dot,
+    solve_covariance
+)
+
+from .quadratic_programming import (
+    feasible_point_for_target,
+    solve_long_only_qp
+)
 
 def portfolio_return(weights, returns, cov_matrix):
     port_return = np.sum(returns * weights) * 252
@@ -10,12 +24,12 @@ def negative_portfolio_return(weights, returns, cov_matrix):
     return - port_return
 
 def portfolio_standard_deviation(weights, returns, cov_matrix):
-    port_std = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights))) \
+    port_std = np.sqrt(np.dot(weights.T, covariance_dot(cov_matrix, weights))) \
         * np.sqrt(252)
     return port_std
 
 def portfolio_variance(weights, returns, cov_matrix):
-    port_var = np.dot(weights.T, np.dot(cov_matrix, weights)) * 252
+    port_var = np.dot(weights.T, covariance_dot(cov_matrix, weights)) * 252
     return port_var
 
 def portfolio_sharpe_ratio(weights, returns, cov_matrix, risk_free_rate):
@@ -44,52 +58,147 @@ def negative_portfolio_with_risk_aversion(weights, returns, cov_matrix, risk_ave
 #     port_var = portfolio_variance(weights, returns, cov_matrix)
 #     return port_return, port_std, port_var
 
-def find_maximum_sharpe_ratio_point(returns, cov_matrix, risk_free_rate):
+def find_maximum_sharpe_ratio_point(returns, cov_matrix, risk_free_rate,
+                                    method='SLSQP', initial_weights=None,
+                                    solver_state=None):
     num_tickers = len(returns)
+    start = get_warm_start(num_tickers, initial_weights, solver_state)
+    if (method == 'active_set'):
+        return _with_solver_state(_find_maximum_sharpe_ratio_point_active_set(
+            returns, cov_matrix, risk_free_rate, start))
     args = (returns, cov_matrix, risk_free_rate)
     constraints = ({'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1})
     bound = (0.0, 1.0)
     bounds = tuple(bound for ticker in range(num_tickers))
     result = sco.minimize(negative_portfolio_sharpe_ratio,
-        num_tickers*[1./num_tickers],
+        num_tickers*[1./num_tickers] if start is None else start,
         args=args, method='SLSQP', bounds=bounds, constraints=constraints)
-    return result
+    return _with_solver_state(result)
 
-def find_portfolio_with_risk_aversion(returns, cov_matrix, risk_aversion):
+def find_hierarchical_risk_parity_point(returns, cov_matrix,
+                                        linkage_method='single'):
+    """
+    - hierarchical risk parity (Lopez de Prado, 2016): assets are
+      clustered by correlation distance sqrt((1 - correlation) / 2),
+      ordered so that correlated assets are neighbors (quasi-
+      diagonalization), then the weight is split top-down between the
+      two halves of the order in inverse proportion to their variances
+      (recursive bisection)
+    - no optimizer and no expected returns are used, so it cannot fail to
+      converge and stays usable for large or ill-conditioned covariances;
+      the clustering costs O(assets^2 log assets)
+    - return <OptimizeResult> with x and fun = portfolio standard deviation
+    """
     num_tickers = len(returns)
+    cov = cov_matrix if isinstance(cov_matrix, FactorCovariance) \
+        else np.asarray(cov_matrix, dtype=float)
+    order = _quasi_diagonal_order(cov, linkage_method)
+    variances = np.maximum(covariance_diagonal(cov), np.finfo(float).tiny)
+    weights = np.ones(num_tickers)
+    clusters = [order] if num_tickers > 1 else []
+    while clusters:
+        halves = []
+        for cluster in clusters:
+            middle = len(cluster) // 2
+            halves.append((cluster[:middle], cluster[middle:]))
+        for left, right in halves:
+            left_variance = _inverse_variance_cluster_variance(
+                cov, variances, left)
+            right_variance = _inverse_variance_cluster_variance(
+                cov, variances, right)
+            alpha = 1. - left_variance / (left_variance + right_variance)
+            weights[left] *= alpha
+            weights[right] *= 1. - alpha
+        clusters = [half for pair in halves for half in pair if len(half) > 1]
+    return _with_solver_state(_closed_form_result(weights,
+        portfolio_standard_deviation(weights, returns, cov_matrix)))
+
+def _quasi_diagonal_order(cov_matrix, linkage_method):
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
+    num_tickers = cov_matrix.shape[0]
+    if (num_tickers < 3):
+        return np.arange(num_tickers)
+    stds = np.sqrt(np.diag(cov_matrix))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = cov_matrix / np.outer(stds, stds)
+    # assets without variance are treated as uncorrelated to the others
+    correlation = np.clip(np.nan_to_num(correlation), -1., 1.)
+    np.fill_diagonal(correlation, 1.)
+    distance = np.sqrt((1. - correlation) / 2.)
+    linkage = sch.linkage(ssd.squareform(distance, checks=False),
+                          method=linkage_method)
+    return sch.leaves_list(linkage)
+
+def _inverse_variance_cluster_variance(cov_matrix, variances, cluster):
+    # variance of the inverse-variance portfolio of the cluster
+    weights = 1. / variances[cluster]
+    weights /= np.sum(weights)
+    if (isinstance(cov_matrix, FactorCovariance)):
+        return np.dot(weights, cov_matrix.take(cluster).dot(weights))
+    return np.dot(weights, cov_matrix[np.ix_(cluster, cluster)].dot(weights))
+
+def find_portfolio_with_risk_aversion(returns, cov_matrix, risk_aversion,
+                                      method='SLSQP', initial_weights=None,
+                                      solver_state=None):
+    num_tickers = len(returns)
+    start = get_warm_start(num_tickers, initial_weights, solver_state)
+    if (method == 'active_set'):
+        return _with_solver_state(_find_portfolio_with_risk_aversion_active_set(
+            returns, cov_matrix, risk_aversion, start))
     args = (returns, cov_matrix, risk_aversion)
     constraints = ({'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1})
     bound = (0.0, 1.0)
     bounds = tuple(bound for ticker in range(num_tickers))
     result = sco.minimize(negative_portfolio_with_risk_aversion,
-        num_tickers*[1./num_tickers],
+        num_tickers*[1./num_tickers] if start is None else start,
         args=args, method='SLSQP', bounds=bounds, constraints=constraints)
-    return result
+    return _with_solver_state(result)
 
-def find_minimum_standard_deviation_point(returns, cov_matrix):
+def find_minimum_standard_deviation_point(returns, cov_matrix, method='SLSQP',
+                                          initial_weights=None,
+                                          solver_state=None):
     num_tickers = len(returns)
+    start = get_warm_start(num_tickers, initial_weights, solver_state)
+    if (method == 'active_set'):
+        return _with_solver_state(
+            _find_minimum_standard_deviation_point_active_set(
+                returns, cov_matrix, start))
     args = (returns, cov_matrix)
     constraints = ({'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1})
     bound = (0.0, 1.0)
     bounds = tuple(bound for ticker in range(num_tickers))
     result = sco.minimize(portfolio_standard_deviation,
-        num_tickers*[1./num_tickers],
+        num_tickers*[1./num_tickers] if start is None else start,
         args=args, method='SLSQP', bounds=bounds, constraints=constraints)
-    return result
+    return _with_solver_state(result)
 
-def find_maximum_return_point(returns, cov_matrix):
+def find_maximum_return_point(returns, cov_matrix, method='SLSQP',
+                              initial_weights=None, solver_state=None):
     num_tickers = len(returns)
+    if (method == 'active_set'):
+        # a linear program, solved by putting everything in the best asset
+        return _with_solver_state(
+            _find_maximum_return_point_closed_form(returns, cov_matrix))
+    start = get_warm_start(num_tickers, initial_weights, solver_state)
     args = (returns, cov_matrix)
     constraints = ({'type': 'eq', 'fun': lambda weights: np.sum(weights) - 1})
     bound = (0.0, 1.0)
     bounds = tuple(bound for ticker in range(num_tickers))
     result = sco.minimize(negative_portfolio_return,
-        num_tickers*[1./num_tickers],
+        num_tickers*[1./num_tickers] if start is None else start,
         args=args, method='SLSQP', bounds=bounds, constraints=constraints)
-    return result
+    return _with_solver_state(result)
 
-def find_efficient_return(returns, cov_matrix, target):
+def find_efficient_return(returns, cov_matrix, target, method='SLSQP',
+                          initial_weights=None, solver_state=None):
     num_tickers = len(returns)
+    start = get_warm_start(num_tickers, initial_weights, solver_state)
+    if (method == 'active_set'):
+        return _with_solver_state(_find_efficient_return_active_set(
+            returns, cov_matrix, target, start))
+    if (start is not None):
+        # SLSQP converges faster from a point that already meets the target
+        start = feasible_point_for_target(returns, target, start)
     args = (returns, cov_matrix)
     constraints = (
         {
@@ -103,6 +212,212 @@ def find_efficient_return(returns, cov_matrix, target):
     )
     bounds = tuple((0,1) for ticker in range(num_tickers))
     result = sco.minimize(portfolio_standard_deviation,
-        num_tickers*[1./num_tickers],
+        num_tickers*[1./num_tickers] if start is None else start,
         args=args, method='SLSQP', bounds=bounds, constraints=constraints)
-    return result
\ No newline at end of file
+    return _with_solver_state(result)
+
+# SLSQP leaves round-off in weights it drives to the bound
+ZERO_WEIGHT = 1e-10
+
+def get_warm_start(num_tickers, initial_weights=None, solver_state=None):
+    """
+    - starting weights for a find_* function from an earlier solution:
+      initial_weights (e.g. last rebalancing round, neighboring target)
+      and / or solver_state (the 'solver_state' of an earlier result)
+    - assets in the saved active set start at zero, the rest of
+      initial_weights (or equal weights if it is not given) is rescaled
+      to sum to 1
+    - return None for a cold start
+    """
+    active_set = None
+    if (solver_state is not None):
+        active_set = np.asarray(solver_state.get('active_set'), dtype=bool)
+        if (active_set.shape != (num_tickers,)):
+            active_set = None
+    if (initial_weights is None):
+        if (active_set is None):
+            return None
+        initial_weights = np.ones(num_tickers)
+    weights = np.asarray(initial_weights, dtype=float)
+    if (weights.shape != (num_tickers,) or not np.all(np.isfinite(weights))):
+        return None
+    if (active_set is not None):
+        pruned = np.where(active_set, 0., weights)
+        if (np.sum(np.clip(pruned, 0., None)) > 0):
+            weights = pruned
+    return _clip_to_simplex(weights)
+
+def _with_solver_state(result):
+    """
+    - add 'solver_state' to a find_* result, to be passed to the next call
+    """
+    if ('active_set' in result):
+        active_set = np.array(result['active_set'], dtype=bool)
+    else:
+        with np.errstate(invalid='ignore'):
+            active_set = np.asarray(result['x'], dtype=float) <= ZERO_WEIGHT
+    result['solver_state'] = {'active_set': active_set}
+    return result
+
+def find_anchor_points(returns, cov_matrix, risk_free_rate):
+    """
+    - minimum standard deviation, maximum sharpe ratio and maximum return
+      points computed together
+    - the covariance is factorized once; when the unconstrained minimum
+      variance or tangency portfolio is already long-only it is the exact
+      answer, otherwise it (clipped) warm-starts the active-set solver
+    - cov_matrix may be a FactorCovariance, which is solved in factor form
+    - return {
+        'minimum_standard_deviation': <OptimizeResult>,
+        'maximum_sharpe_ratio': <OptimizeResult>,
+        'maximum_return': <OptimizeResult>
+      }
+    """
+    num_tickers = len(returns)
+    excess_returns = np.asarray(returns, dtype=float) * 252 - risk_free_rate
+    try:
+        unconstrained = solve_covariance(cov_matrix,
+            np.column_stack([np.ones(num_tickers), excess_returns]))
+    except np.linalg.LinAlgError:
+        unconstrained = np.full((num_tickers, 2), np.nan)
+
+    min_std_start = _clip_to_simplex(unconstrained[:, 0])
+    if (min_std_start is not None and np.all(unconstrained[:, 0] >= 0)):
+        min_std = _closed_form_result(min_std_start,
+            portfolio_standard_deviation(min_std_start, returns, cov_matrix))
+    else:
+        min_std = _find_minimum_standard_deviation_point_active_set(
+            returns, cov_matrix, min_std_start)
+
+    tangency = unconstrained[:, 1]
+    max_sharpe_start = _clip_to_simplex(tangency)
+    if (max_sharpe_start is not None and np.all(tangency >= 0) \
+        and np.dot(excess_returns, tangency) > 0):
+        max_sharpe = _closed_form_result(max_sharpe_start,
+            negative_portfolio_sharpe_ratio(
+                max_sharpe_start, returns, cov_matrix, risk_free_rate))
+    else:
+        max_sharpe = _find_maximum_sharpe_ratio_point_active_set(
+            returns, cov_matrix, risk_free_rate, max_sharpe_start)
+
+    max_return = _find_maximum_return_point_closed_form(returns, cov_matrix)
+    return {
+        'minimum_standard_deviation': _with_solver_state(min_std),
+        'maximum_sharpe_ratio': _with_solver_state(max_sharpe),
+        'maximum_return': _with_solver_state(max_return)
+    }
+
+def _clip_to_simplex(weights):
+    weights = np.clip(weights, 0., None)
+    total = np.sum(weights)
+    if (not np.isfinite(total) or total <= 0):
+        return None
+    return weights / total
+
+def _closed_form_result(weights, fun):
+    return sco.OptimizeResult(x=weights, fun=fun, success=True, status=0,
+        message='Closed-form solution', nit=0, nfev=0, active_set=weights <= 0)
+
+def _find_maximum_return_point_closed_form(returns, cov_matrix):
+    weights = np.zeros(len(returns))
+    weights[int(np.argmax(np.asarray(returns, dtype=float)))] = 1.
+    return _closed_form_result(weights,
+        negative_portfolio_return(weights, returns, cov_matrix))
+
+def _find_minimum_standard_deviation_point_active_set(returns, cov_matrix,
+                                                      x0=None):
+    num_tickers = len(returns)
+    if (x0 is None):
+        x0 = num_tickers*[1./num_tickers]
+    result = solve_long_only_qp(cov_matrix, np.ones((1, num_tickers)),
+        np.ones(1), x0)
+    result['fun'] = portfolio_standard_deviation(result['x'], returns, cov_matrix)
+    return result
+
+def _find_efficient_return_active_set(returns, cov_matrix, target, x0=None):
+    num_tickers = len(returns)
+    start = feasible_point_for_target(returns, target, x0)
+    if (start is None):
+        return sco.OptimizeResult(x=np.full(num_tickers, np.nan), fun=np.nan,
+            success=False, status=2, message='Target return is not attainable',
+            nit=0, nfev=0)
+    constraint_matrix = np.vstack([np.ones(num_tickers),
+                                   np.asarray(returns, dtype=float) * 252])
+    result = solve_long_only_qp(cov_matrix, constraint_matrix,
+        np.array([1., target]), start)
+    result['fun'] = portfolio_standard_deviation(result['x'], returns, cov_matrix)
+    return result
+
+def _find_maximum_sharpe_ratio_point_active_set(returns, cov_matrix,
+                                                risk_free_rate, x0=None):
+    # minimize y' cov y subject to (returns * 252 - risk_free_rate)' y = 1,
+    # y >= 0, then weights = y / sum(y)
+    num_tickers = len(returns)
+    excess_returns = np.asarray(returns, dtype=float) * 252 - risk_free_rate
+    best = int(np.argmax(excess_returns))
+    if (excess_returns[best] <= 0):
+        # no asset beats the risk-free rate: the sharpe ratio is then
+        # quasi-convex and maximized at a vertex, i.e. a single asset
+        stds = np.sqrt(covariance_diagonal(cov_matrix) * 252)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpes = np.where(stds > 0, excess_returns / stds, -np.inf)
+        x = np.zeros(num_tickers)
+        x[int(np.argmax(sharpes))] = 1.
+        return sco.OptimizeResult(x=x,
+            fun=negative_portfolio_sharpe_ratio(
+                x, returns, cov_matrix, risk_free_rate),
+            success=True, status=0,
+            message='No asset beats the risk-free rate', nit=0, nfev=0)
+
+    start = None
+    if (x0 is not None):
+        start = np.clip(np.asarray(x0, dtype=float), 0., None)
+        start[excess_returns <= 0] = 0.
+        if (np.dot(excess_returns, start) > 0):
+            start /= np.dot(excess_returns, start)
+        else:
+            start = None
+    if (start is None):
+        start = np.zeros(num_tickers)
+        start[best] = 1. / excess_returns[best]
+    result = solve_long_only_qp(cov_matrix, excess_returns[np.newaxis, :],
+        np.ones(1), start)
+    result['x'] = result['x'] / np.sum(result['x'])
+    result['fun'] = negative_portfolio_sharpe_ratio(
+        result['x'], returns, cov_matrix, risk_free_rate)
+    return result
+
+def _find_portfolio_with_risk_aversion_active_set(returns, cov_matrix,
+                                                  risk_aversion, x0=None):
+    # the optimum lies on the efficient frontier, where the objective is
+    # convex in the target return, so search over the target with one QP
+    # per evaluation (each warm-started from the previous weights)
+    lowest = portfolio_return(
+        find_minimum_standard_deviation_point(
+            returns, cov_matrix, method='active_set')['x'],
+        returns, cov_matrix)
+    highest = np.max(np.asarray(returns, dtype=float)) * 252
+    state = {'x': x0, 'nit': 0, 'nfev': 0}
+
+    def objective(target):
+        result = _find_efficient_return_active_set(
+            returns, cov_matrix, target, state['x'])
+        state['x'] = result['x']
+        state['nit'] += result['nit']
+        state['nfev'] += result['nfev']
+        return - target + (risk_aversion / 2) * result['fun']
+
+    if (highest - lowest > 0):
+        search = sco.minimize_scalar(objective, bounds=(lowest, highest),
+                                     method='bounded')
+        candidates = [search['x'], lowest, highest]
+    else:
+        candidates = [lowest]
+    best_target = min(candidates, key=objective)
+    result = _find_efficient_return_active_set(
+        returns, cov_matrix, best_target, state['x'])
+    result['fun'] = negative_portfolio_with_risk_aversion(
+        result['x'], returns, cov_matrix, risk_aversion)
+    result['nit'] += state['nit']
+    result['nfev'] += state['nfev']
+    return result
@@ -0,0 +1,145 @@
+import numpy as np
+import scipy.linalg as scl
+import scipy.optimize as sco
+
+from .covariance import (
+    FactorCovariance
+)
+
+
+def feasible_point_for_target(returns, target, weights=None):
+    """
+    - long-only, fully-invested weights whose annualized return is target
+    - if weights is given, it is moved toward the highest (or lowest)
+      return asset just enough to reach target, so most of its support
+      is kept
+    - return None when target is not attainable
+    """
+    annual_returns = np.asarray(returns, dtype=float) * 252
+    highest = int(np.argmax(annual_returns))
+    lowest = int(np.argmin(annual_returns))
+    if (target > annual_returns[highest] or target < annual_returns[lowest]):
+        return None
+
+    if (weights is None):
+        if (annual_returns[highest] == annual_returns[lowest]):
+            weights = np.zeros(len(annual_returns))
+            weights[highest] = 1.
+            return weights
+        share = (target - annual_returns[lowest]) / \
+            (annual_returns[highest] - annual_returns[lowest])
+        weights = np.zeros(len(annual_returns))
+        weights[highest] += share
+        weights[lowest] += 1. - share
+        return weights
+
+    weights = np.clip(np.asarray(weights, dtype=float), 0., None)
+    weights /= np.sum(weights)
+    current = np.dot(annual_returns, weights)
+    extreme = highest if target > current else lowest
+    if (annual_returns[extreme] == current):
+        return weights
+    share = (target - current) / (annual_returns[extreme] - current)
+    weights *= 1. - share
+    weights[extreme] += share
+    return weights
+
+
+def _solve_free_block(hessian, free, rhs):
+    if (isinstance(hessian, FactorCovariance)):
+        # the free block of a factor model is a factor model, solved in
+        # O(free x factors^2) instead of O(free^3)
+        block = hessian.take(free)
+        try:
+            return block.solve(rhs)
+        except np.linalg.LinAlgError:
+            return np.linalg.lstsq(block.toarray(), rhs, rcond=None)[0]
+    block = hessian[np.ix_(free, free)]
+    try:
+        factor = scl.cho_factor(block)
+        return scl.cho_solve(factor, rhs)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(block, rhs, rcond=None)[0]
+
+
+def solve_long_only_qp(cov_matrix, constraint_matrix, constraint_vector, x0,
+                       maxiter=None, tol=1e-10):
+    """
+    - primal active-set method for
+          minimize    0.5 * x' cov_matrix x
+          subject to  constraint_matrix x = constraint_vector, x >= 0
+    - x0 must be feasible; indices where x0 is zero start in the active set
+    - every step solves the equality-constrained subproblem on the free
+      assets exactly (range-space method), so no gradient is estimated
+    - cov_matrix may be a FactorCovariance, then every iteration costs
+      O(assets x factors^2) instead of O(assets^2) or more
+    - return scipy OptimizeResult with x, nit, nfev (hessian products)
+      and active_set (boolean mask of assets held at zero)
+    """
+    hessian = cov_matrix if isinstance(cov_matrix, FactorCovariance) \
+        else np.asarray(cov_matrix, dtype=float)
+    A = np.atleast_2d(np.asarray(constraint_matrix, dtype=float))
+    num_tickers = hessian.shape[0]
+    if (maxiter is None):
+        maxiter = 10 * num_tickers + 100
+
+    x = np.array(x0, dtype=float)
+    active = x <= 0
+    x[active] = 0.
+
+    nit = 0
+    nfev = 0
+    success = False
+    message = 'Iteration limit reached'
+    while nit < maxiter:
+        nit += 1
+        free = np.flatnonzero(~active)
+        gradient = hessian.dot(x)
+        nfev += 1
+
+        A_free = A[:, free]
+        solved = _solve_free_block(
+            hessian, free, np.column_stack([gradient[free], A_free.T]))
+        u, V = solved[:, 0], solved[:, 1:]
+        schur = A_free.dot(V)
+        multipliers = np.linalg.lstsq(schur, A_free.dot(u), rcond=None)[0]
+        step = V.dot(multipliers) - u
+
+        scale = max(np.abs(gradient).max(), np.finfo(float).tiny)
+        if (np.abs(step).max() <= tol):
+            if (not active.any()):
+                success = True
+                break
+            full_step = np.zeros(num_tickers)
+            full_step[free] = step
+            bound_multipliers = hessian.dot(x + full_step) - A.T.dot(multipliers)
+            nfev += 1
+            bound_multipliers[~active] = np.inf
+            release = int(np.argmin(bound_multipliers))
+            if (bound_multipliers[release] >= -tol * scale):
+                success = True
+                break
+            active[release] = False
+            continue
+
+        alpha = 1.
+        blocking = None
+        decreasing = step < 0
+        if (decreasing.any()):
+            ratios = -x[free][decreasing] / step[decreasing]
+            smallest = int(np.argmin(ratios))
+            if (ratios[smallest] < 1.):
+                alpha = ratios[smallest]
+                blocking = free[decreasing][smallest]
+        x[free] += alpha * step
+        if (blocking is not None):
+            active[blocking] = True
+            x[blocking] = 0.
+        x[x < 0] = 0.
+
+    if (success):
+        message = 'Optimization terminated successfully'
+    return sco.OptimizeResult(x=x, fun=0.5 * np.dot(x, hessian.dot(x)),
+                              success=success, status=0 if success else 1,
+                              message=message, nit=nit, nfev=nfev,
+                              active_set=active)
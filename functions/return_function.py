@@ -5,6 +5,18 @@ from functions.portfolio import (
     portfolio_variance
 )
 
+from functions.covariance import (
+    estimate_covariance
+)
+
+from functions.black_litterman import (
+    BlackLittermanPrior,
+    compile_views,
+    get_black_litterman_prior,
+    get_view_table,
+    views_to_table
+)
+
 def mean_returns_function(daily_returns, **kwargs):
     mean_returns = daily_returns.mean()
     return mean_returns
@@ -17,34 +29,10 @@ def create_views_and_link_matrix(names, views):
             ('AAPL', '>', 'FB', '0.05'),
             ('GOOGL', '=', '0.35')
         }
+        # compile_views builds the same Q and a sparse P from a view table
     """
-    # Q = [views[i][3]/252 for i in range(len(views))]  # view matrix
-    Q = []
-    for view in views:
-        isRelativeView = view[1] == '<' or view[1] == '>'
-        isAbsoluteView = view[1] == '='
-        if (isRelativeView):
-            Q.append(view[3] / 252)
-        elif (isAbsoluteView):
-            Q.append(view[2] / 252)
-        else:
-            raise ValueError('incorrect view format')
-
-    P = np.zeros([len(views), len(names)])
-    nameToIndex = dict()
-    for index, name in enumerate(names):
-        nameToIndex[name] = index
-    for index, _ in enumerate(views):
-        isRelativeView = views[index][1] == '<' or views[index][1] == '>'
-        isAbsoluteView = views[index][1] == '='
-        if (isRelativeView):
-            name1, name2 = views[index][0], views[index][2]
-            P[index, nameToIndex[name1]] = +1 if views[index][1] == '>' else -1
-            P[index, nameToIndex[name2]] = -1 if views[index][1] == '>' else +1
-        elif (isAbsoluteView):
-            name = views[index][0]
-            P[index, nameToIndex[name]] = 1
-    return np.array(Q), P
+    Q, P = compile_views(names, views_to_table(views))
+    return Q, P.toarray()
 
 def equilibriumExcessReturns(
                     market_cap, returns, cov_matrix, risk_free_rate):
@@ -56,36 +44,51 @@ def equilibriumExcessReturns(
     return pi
 
 def equilibriumExcessReturnsAdjustedViews(pi, cov_matrix, Q, P):
-    tau = .025
-    omega = np.dot(np.dot(np.dot(tau, P), cov_matrix), np.transpose(P))
-
-    sub_a = np.linalg.inv(np.dot(tau, cov_matrix))
-    sub_b = np.dot(np.dot(np.transpose(P), np.linalg.inv(omega)), P)
-    sub_c = np.dot(np.linalg.inv(np.dot(tau, cov_matrix)), pi)
-    sub_d = np.dot(np.dot(np.transpose(P), np.linalg.inv(omega)), Q)
-    pi_adj = np.dot(np.linalg.inv(sub_a + sub_b), (sub_c + sub_d))
+    # omega = tau * P * cov_matrix * P', solved without explicit inverses
+    pi_adj = BlackLittermanPrior(pi, cov_matrix).posterior(Q, P)
     return pi_adj
 
-def black_litterman_returns_function(daily_returns, **kwargs):
-    tickers = kwargs['tickers']
-    market_cap = kwargs['market_cap']
-    risk_free_rate = kwargs['risk_free_rate']
-    views = kwargs['views']
-
+def get_prior(daily_returns, tickers, market_cap, risk_free_rate,
+              covariance='sample'):
     mean_returns = daily_returns.mean()
-    cov_matrix = daily_returns.cov()
-
-    # ### shrinkage
-    # cov = LedoitWolf().fit(daily_returns.dropna().values)
-    # cov_matrix = cov.covariance_
+    # e.g. covariance='ledoit_wolf' for shrinkage
+    cov_matrix = estimate_covariance(daily_returns, covariance)
 
     market_cap_list = []
     for ticker in tickers:
         market_cap_value = market_cap[ticker]
         market_cap_list.append(market_cap_value)
 
-    pi = equilibriumExcessReturns(
+    return get_black_litterman_prior(
         market_cap_list, mean_returns, cov_matrix, risk_free_rate)
-    Q, P = create_views_and_link_matrix(tickers, views)
-    pi_adj = equilibriumExcessReturnsAdjustedViews(pi, cov_matrix, Q, P)
+
+def black_litterman_returns_function(daily_returns, **kwargs):
+    tickers = kwargs['tickers']
+    market_cap = kwargs['market_cap']
+    risk_free_rate = kwargs['risk_free_rate']
+    views = kwargs['views']
+    covariance = kwargs.get('covariance', 'sample')
+
+    prior = get_prior(daily_returns, tickers, market_cap, risk_free_rate,
+                      covariance)
+    Q, P = compile_views(tickers, get_view_table(views))
+    pi_adj = prior.posterior(Q, P)
     return pi_adj
+
+def black_litterman_scenarios_function(daily_returns, **kwargs):
+    """
+    - black_litterman_returns_function for many view sets at once,
+      kwargs['views_list'] = [views, ...] instead of kwargs['views'],
+      where views may also be a view table of compile_views
+    - return <np.ndarray> one row of adjusted returns per view set
+    """
+    tickers = kwargs['tickers']
+    market_cap = kwargs['market_cap']
+    risk_free_rate = kwargs['risk_free_rate']
+    views_list = kwargs['views_list']
+    covariance = kwargs.get('covariance', 'sample')
+
+    prior = get_prior(daily_returns, tickers, market_cap, risk_free_rate,
+                      covariance)
+    return prior.posteriors([compile_views(tickers, get_view_table(views))
+                             for views in views_list])
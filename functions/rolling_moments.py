@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class RollingMoments:
+    """
+    - mean and covariance of a sliding window of rows, updated as rows
+      enter and leave instead of recomputed from the whole window
+    - batches are combined with the pairwise (Chan / Welford) update on
+      centered sums, which stays accurate where raw sums of squares would
+      cancel; the window is rebuilt from scratch after as many removals as
+      it has rows, so round-off from removals cannot pile up
+    - rows must not contain nan, callers that have missing values fill
+      them (e.g. with 0) and ignore the affected columns
+        moments = RollingMoments(daily_returns)
+        moments.set_window(0, 252)
+        moments.set_window(80, 332) # adds 80 rows, removes 80 rows
+        moments.mean(), moments.cov()
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.first = 0
+        self.last = 0
+        self.count = 0
+        self._mean = np.zeros(rows.shape[1])
+        self._comoment = np.zeros((rows.shape[1], rows.shape[1]))
+        self._removed = 0
+
+    def set_window(self, first, last):
+        """
+        - make the window rows [first, last)
+        """
+        if (first >= last or last <= self.first or first >= self.last \
+            or first < self.first \
+            or self._removed + max(first - self.first, 0) > self.count):
+            self._reset(first, last)
+            return
+        if (last > self.last):
+            self._add(self.rows[self.last:last])
+        elif (last < self.last):
+            self._remove(self.rows[last:self.last])
+        if (first > self.first):
+            self._remove(self.rows[self.first:first])
+        self.first, self.last = first, last
+
+    def mean(self, columns=None):
+        if (columns is None):
+            return self._mean.copy()
+        return self._mean[columns]
+
+    def cov(self, columns=None):
+        """
+        - sample covariance (ddof=1) of the window, like np.cov
+        """
+        comoment = self._comoment
+        if (columns is not None):
+            columns = np.flatnonzero(columns) if np.asarray(columns).dtype == bool \
+                else np.asarray(columns)
+            comoment = comoment[np.ix_(columns, columns)]
+        return comoment / (self.count - 1)
+
+    def _reset(self, first, last):
+        self.count = 0
+        self._mean[:] = 0
+        self._comoment[:] = 0
+        self._removed = 0
+        self.first, self.last = first, max(first, last)
+        self._add(self.rows[self.first:self.last])
+
+    def _add(self, rows):
+        batch_count = len(rows)
+        if (batch_count == 0):
+            return
+        batch_mean = np.mean(rows, axis=0)
+        centered = rows - batch_mean
+        batch_comoment = centered.T.dot(centered)
+
+        count = self.count + batch_count
+        delta = batch_mean - self._mean
+        self._mean += delta * (batch_count / float(count))
+        self._comoment += batch_comoment \
+            + np.outer(delta, delta) * (self.count * batch_count / float(count))
+        self.count = count
+
+    def _remove(self, rows):
+        batch_count = len(rows)
+        if (batch_count == 0):
+            return
+        count = self.count - batch_count
+        batch_mean = np.mean(rows, axis=0)
+        centered = rows - batch_mean
+        batch_comoment = centered.T.dot(centered)
+
+        mean = (self._mean * self.count - batch_mean * batch_count) / count
+        delta = batch_mean - mean
+        self._comoment -= batch_comoment \
+            + np.outer(delta, delta) * (count * batch_count / float(self.count))
+        self._mean = mean
+        self.count = count
+        self._removed += batch_count
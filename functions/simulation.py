@@ -0,0 +1,137 @@
+import numpy as np
+from multiprocessing import Pool
+
+
+def evaluate_portfolios(weights, returns, cov_matrix, risk_free_rate):
+    """
+    - weights = <array num_portfolios x num_tickers>
+    - return <array 3 x num_portfolios> of annualized return,
+      annualized standard deviation and sharpe ratio, like
+      random_portfolios
+    """
+    returns = np.asarray(returns, dtype=float)
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
+    port_returns = weights.dot(returns) * 252
+    port_stds = np.sqrt(np.sum(weights.dot(cov_matrix) * weights, axis=1) * 252)
+    port_sharpes = (port_returns - risk_free_rate) / port_stds
+    return np.vstack([port_returns, port_stds, port_sharpes])
+
+def random_weights(num_portfolios, num_tickers, random_state=np.random):
+    weights = random_state.random_sample((num_portfolios, num_tickers))
+    weights /= np.sum(weights, axis=1)[:, np.newaxis]
+    return weights
+
+def _top_k(results, weights, top_k):
+    if (results.shape[1] > top_k):
+        best = np.argpartition(-results[2], top_k - 1)[:top_k]
+        results, weights = results[:, best], weights[best]
+    order = np.argsort(-results[2], kind='mergesort')
+    return results[:, order], weights[order]
+
+def _histogram_edges(low, high, bins):
+    # equal values would give edges that do not increase
+    if (high <= low):
+        spread = max(abs(low), abs(high), 1.) * 1e-9
+        low, high = low - spread, high + spread
+    return np.linspace(low, high, bins + 1)
+
+_worker_problem = None
+
+def _init_worker(problem):
+    global _worker_problem
+    _worker_problem = problem
+
+def _simulate_chunk(chunk):
+    seed, size = chunk
+    problem = _worker_problem
+    weights = random_weights(size, len(problem['returns']),
+                             np.random.RandomState(seed))
+    results = evaluate_portfolios(weights, problem['returns'],
+        problem['cov_matrix'], problem['risk_free_rate'])
+    if (problem['reduction'] == 'top_k'):
+        return _top_k(results, weights, problem['top_k'])
+    elif (problem['reduction'] == 'histogram'):
+        counts, _, _ = np.histogram2d(results[1], results[0],
+            bins=[problem['std_edges'], problem['return_edges']])
+        return counts
+    return results, weights
+
+def simulate_random_portfolios(num_portfolios, returns, cov_matrix,
+                               risk_free_rate, reduction='all', top_k=100,
+                               bins=100, chunk_size=100000, num_workers=1,
+                               seed=None):
+    """
+    - batched version of random_portfolios, evaluated chunk_size
+      portfolios at a time so memory stays bounded by the chunk
+    - every chunk has its own random stream, so the output only depends
+      on seed, never on num_workers
+    - reduction
+        'all' -> results <array 3 x num_portfolios>,
+                 weights <array num_portfolios x num_tickers>
+        'top_k' -> the top_k portfolios by sharpe ratio, best first,
+                   as (results, weights)
+        'histogram' -> (counts, std_edges, return_edges), a 2-D histogram
+                       of annualized standard deviation against return
+    """
+    if (reduction not in ('all', 'top_k', 'histogram')):
+        raise ValueError('reduction must be one of [all, top_k, histogram].')
+    returns = np.asarray(returns, dtype=float)
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
+    problem = {
+        'returns': returns,
+        'cov_matrix': cov_matrix,
+        'risk_free_rate': risk_free_rate,
+        'reduction': reduction,
+        'top_k': top_k
+    }
+    if (reduction == 'histogram'):
+        # every long-only portfolio lies inside these bounds
+        problem['std_edges'] = _histogram_edges(
+            0, np.sqrt(np.max(np.diag(cov_matrix)) * 252), bins)
+        problem['return_edges'] = _histogram_edges(
+            np.min(returns) * 252, np.max(returns) * 252, bins)
+
+    num_chunks = int(np.ceil(num_portfolios / float(chunk_size)))
+    seeds = np.random.RandomState(seed).randint(
+        0, 2**31 - 1, size=num_chunks)
+    sizes = [min(chunk_size, num_portfolios - i * chunk_size)
+             for i in range(num_chunks)]
+    chunks = list(zip(seeds, sizes))
+
+    if (num_workers > 1):
+        pool = Pool(num_workers, initializer=_init_worker, initargs=(problem,))
+        try:
+            outputs = pool.imap(_simulate_chunk, chunks)
+            reduced = _reduce_chunks(outputs, problem)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(problem)
+        reduced = _reduce_chunks(map(_simulate_chunk, chunks), problem)
+    return reduced
+
+def _reduce_chunks(outputs, problem):
+    reduction = problem['reduction']
+    if (reduction == 'histogram'):
+        counts = np.zeros((len(problem['std_edges']) - 1,
+                           len(problem['return_edges']) - 1))
+        for chunk_counts in outputs:
+            counts += chunk_counts
+        return counts, problem['std_edges'], problem['return_edges']
+
+    num_tickers = len(problem['returns'])
+    results = np.zeros((3, 0))
+    weights = np.zeros((0, num_tickers))
+    if (reduction == 'top_k'):
+        for chunk_results, chunk_weights in outputs:
+            results, weights = _top_k(
+                np.hstack([results, chunk_results]),
+                np.vstack([weights, chunk_weights]), problem['top_k'])
+        return results, weights
+
+    outputs = list(outputs)
+    if (outputs):
+        results = np.hstack([chunk_results for chunk_results, _ in outputs])
+        weights = np.vstack([chunk_weights for _, chunk_weights in outputs])
+    return results, weights
@@ -1,11 +1,22 @@
 import numpy as np
 import pandas as pd
 import math
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+from .covariance import (
+    estimate_covariance
+)
+
+from .rolling_moments import (
+    RollingMoments
+)
+
 from .portfolio import (
     portfolio_return,
     portfolio_standard_deviation,
+    find_hierarchical_risk_parity_point,
     find_maximum_sharpe_ratio_point
 )
 
@@ -39,21 +50,235 @@ def split_dataframe(dataframe, first_half_period=None, second_half_period=None):
             second_half_dataframe = dataframe[-second_half_period:]
     return first_half_dataframe, second_half_dataframe
 
-def get_optimal_weights(dataframe, returns_function, risk_free_rate, **kwargs):
+ALLOCATIONS = ('maximum_sharpe_ratio', 'hierarchical_risk_parity')
+
+def find_optimal_weights(training_returns, cov_matrix, risk_free_rate,
+                         initial_weights=None,
+                         allocation='maximum_sharpe_ratio'):
+    """
+    - allocation = 'maximum_sharpe_ratio' (active-set solver, started from
+                   initial_weights if given)
+                   'hierarchical_risk_parity' (no solver, ignores the
+                   expected returns)
+    """
+    if (allocation == 'hierarchical_risk_parity'):
+        return find_hierarchical_risk_parity_point(
+            training_returns, cov_matrix)['x']
+    if (allocation != 'maximum_sharpe_ratio'):
+        raise ValueError('allocation must be one of %s' % (ALLOCATIONS,))
+    return find_maximum_sharpe_ratio_point(
+        training_returns, cov_matrix, risk_free_rate, method='active_set',
+        initial_weights=initial_weights)['x']
+
+def get_optimal_weights(dataframe, returns_function, risk_free_rate,
+                        initial_weights=None, covariance='sample',
+                        allocation='maximum_sharpe_ratio', **kwargs):
+    """
+    - covariance = name of the estimator in functions.covariance, also
+      passed on to returns_function
+    - allocation = see find_optimal_weights
+    """
     daily_returns = dataframe.pct_change()
-    cov_matrix = daily_returns.cov()
+    cov_matrix = estimate_covariance(daily_returns, covariance)
 
     kwargs['risk_free_rate'] = risk_free_rate
+    kwargs['covariance'] = covariance
     training_returns = returns_function(daily_returns, **kwargs)
 
-    optimal_weights = find_maximum_sharpe_ratio_point(
-        training_returns, cov_matrix, risk_free_rate)['x']
+    optimal_weights = find_optimal_weights(training_returns, cov_matrix,
+        risk_free_rate, initial_weights, allocation)
     return optimal_weights
 
+def get_optimal_weights_from_returns(daily_returns, columns, returns_function,
+                                    risk_free_rate, cov_matrix=None,
+                                    initial_weights=None, covariance='sample',
+                                    allocation='maximum_sharpe_ratio',
+                                    **kwargs):
+    """
+    - get_optimal_weights for a daily returns array without missing values
+    - returns_function still receives a dataframe, which wraps the array
+      without copying it
+    - initial_weights = starting point of the solver, e.g. the weights of
+      the previous rebalancing round
+    """
+    if (cov_matrix is None):
+        cov_matrix = estimate_covariance(daily_returns, covariance)
+
+    kwargs['risk_free_rate'] = risk_free_rate
+    kwargs['covariance'] = covariance
+    training_returns = returns_function(
+        pd.DataFrame(daily_returns, columns=columns, copy=False), **kwargs)
+
+    optimal_weights = find_optimal_weights(training_returns, cov_matrix,
+        risk_free_rate, initial_weights, allocation)
+    return optimal_weights
+
+BacktestData = namedtuple(
+    'BacktestData', ['index', 'columns', 'daily_returns', 'missing_count'])
+
+def prepare_backtest_data(dataframe):
+    """
+    - daily returns of every column computed once, columns sorted by name
+    - missing_count[t] = number of missing prices in rows [0, t) per
+      column, so the columns without missing prices in rows
+      [first, last) are found in O(number of columns)
+    """
+    order = np.argsort(dataframe.columns.values, kind='mergesort')
+    columns = dataframe.columns.values[order]
+    prices = np.asarray(dataframe.values, dtype=float)[:, order]
+    daily_returns = np.full(prices.shape, np.nan)
+    daily_returns[1:] = prices[1:] / prices[:-1] - 1
+    missing_count = np.zeros((len(prices) + 1, len(columns)), dtype=np.int64)
+    np.cumsum(np.isnan(prices), axis=0, out=missing_count[1:])
+    return BacktestData(dataframe.index, columns, daily_returns, missing_count)
+
+def get_complete_columns(data, first, last):
+    return data.missing_count[last] == data.missing_count[first]
+
+def get_round_windows(data, training_period, rebalancing_period, slicing, i):
+    """
+    - price rows [training_start, training_end) are trained on and
+      [training_end, testing_end) are tested on in round i
+    """
+    training_end = training_period + rebalancing_period * i
+    training_start = rebalancing_period * i if slicing else 0
+    testing_end = min(training_end + rebalancing_period, len(data.index))
+    return training_start, training_end, testing_end
+
+def run_rebalancing_round(data, returns_function, risk_free_rate,
+                          training_period, rebalancing_period, slicing, i,
+                          training_cov_matrix=None, previous_weights=None,
+                          **kwargs):
+    """
+    - train on the data before round i, test on the next rebalancing_period
+      days; data = prepare_backtest_data(dataframe)
+    - training_cov_matrix = covariance of all columns over the training
+      returns, if already known
+    - previous_weights = <pd.Series> weights by ticker to start the solver
+      from, tickers missing from it start at 0
+    - return (allocation, port returns, port std, number of testing days,
+      <pd.Series> optimal weights), or None when the round has too few
+      tickers
+    """
+    # split data
+    training_start, training_end, testing_end = get_round_windows(
+        data, training_period, rebalancing_period, slicing, i)
+
+    # keep tickers without missing prices in both windows
+    training_columns = get_complete_columns(data, training_start, training_end)
+    testing_columns = get_complete_columns(data, training_end, testing_end)
+    if training_end <= training_start or testing_end <= training_end \
+       or np.sum(training_columns) < 2 or np.sum(testing_columns) < 2:
+        return None
+    common = training_columns & testing_columns
+    common_columns = data.columns[common]
+
+    # returns of the first row of a window need the price before it
+    training_returns_r = data.daily_returns[training_start + 1:training_end][:, common]
+    testing_returns_r = data.daily_returns[training_end + 1:testing_end][:, common]
+
+    # training / get optimal weights
+    if (training_cov_matrix is not None):
+        training_cov_matrix = training_cov_matrix[np.ix_(common, common)]
+    initial_weights = None
+    if (previous_weights is not None):
+        initial_weights = previous_weights.reindex(common_columns) \
+            .fillna(0).values
+    kwargs['tickers'] = common_columns
+    optimal_weights_r = get_optimal_weights_from_returns(
+        training_returns_r, common_columns, returns_function, risk_free_rate,
+        training_cov_matrix, initial_weights, **kwargs
+    )
+    buy_date = data.index[training_end - 1:training_end].format()[0]
+    allocation = get_allocation(common_columns, optimal_weights_r, buy_date)
+
+    # testing / get port returns, port std
+    port_interval_r = testing_end - training_end
+    testing_mean_returns_r = np.mean(testing_returns_r, axis=0)
+    testing_cov_matrix_r = np.cov(testing_returns_r, rowvar=False)
+
+    port_returns_r = portfolio_return(
+        optimal_weights_r, testing_mean_returns_r, testing_cov_matrix_r)
+    port_std_r = portfolio_standard_deviation(
+        optimal_weights_r, testing_mean_returns_r, testing_cov_matrix_r)
+    return allocation, port_returns_r, port_std_r, port_interval_r, \
+        pd.Series(optimal_weights_r, index=common_columns)
+
+def run_rebalancing_rounds(data, rounds, returns_function, risk_free_rate,
+                           training_period, rebalancing_period, slicing,
+                           **kwargs):
+    """
+    - results of run_rebalancing_round for the given rounds, in order
+    - consecutive training windows overlap, so their sample covariances
+      are updated with the rows that changed instead of recomputed, and
+      each round's solver starts from the previous round's weights, which
+      are usually close to the new optimum
+    """
+    moments = RollingMoments(np.nan_to_num(data.daily_returns))
+    rolling = kwargs.get('covariance', 'sample') == 'sample'
+    round_results = []
+    previous_weights = None
+    for i in rounds:
+        training_start, training_end, _ = get_round_windows(
+            data, training_period, rebalancing_period, slicing, i)
+        training_cov_matrix = None
+        if (rolling and training_end - training_start > 2):
+            moments.set_window(training_start + 1, training_end)
+            training_cov_matrix = moments.cov()
+        round_result = run_rebalancing_round(
+            data, returns_function, risk_free_rate, training_period,
+            rebalancing_period, slicing, i, training_cov_matrix,
+            previous_weights, **dict(kwargs))
+        if (round_result is not None):
+            previous_weights = round_result[-1]
+        round_results.append(round_result)
+    return round_results
+
+# the returns matrix is sent to each worker process once, when it starts,
+# instead of once per task
+_worker_data = None
+
+def _init_walk_forward_worker(data):
+    global _worker_data
+    _worker_data = data
+
+def _run_rebalancing_rounds_in_worker(task):
+    rounds, args, kwargs = task
+    return run_rebalancing_rounds(_worker_data, rounds, *args, **kwargs)
+
+def run_walk_forward(dataframe, returns_function, risk_free_rate,
+                     training_period, rebalancing_period, total_round,
+                     slicing=False, num_workers=1, **kwargs):
+    """
+    - results of run_rebalancing_round for every round, in round order
+    - with num_workers > 1 the rounds are split into consecutive chunks
+      that run on a process pool; a task only carries its round numbers
+      and each worker computes its own covariances
+    - the first round of a chunk starts its solver from scratch instead of
+      from the previous round's weights, so the pool and the serial loop
+      agree up to the solver's tolerance, not bit for bit
+    """
+    data = prepare_backtest_data(dataframe)
+    args = (returns_function, risk_free_rate, training_period,
+            rebalancing_period, slicing)
+    if (num_workers > 1):
+        # a few chunks per worker keep the workers busy when rounds with
+        # longer training windows take longer
+        chunks = np.array_split(np.arange(total_round),
+                                max(1, min(total_round, num_workers * 4)))
+        tasks = [(chunk.tolist(), args, kwargs) for chunk in chunks]
+        with ProcessPoolExecutor(max_workers=num_workers,
+                                 initializer=_init_walk_forward_worker,
+                                 initargs=(data,)) as pool:
+            return [round_result for chunk_results in
+                    pool.map(_run_rebalancing_rounds_in_worker, tasks)
+                    for round_result in chunk_results]
+    return run_rebalancing_rounds(data, range(total_round), *args, **kwargs)
+
 def test_portfolio_performance(dataframe, returns_function, risk_free_rate,
                                training_period=None, testing_period=None,
                                rebalancing_period=None, slicing=False,
-                               text='', **kwargs):
+                               text='', num_workers=1, **kwargs):
     print('-' * 80)
     print(text)
     print('')
@@ -86,51 +311,17 @@ def test_portfolio_performance(dataframe, returns_function, risk_free_rate,
         port_interval_result = [] # how many days when calculating port returns
                                   # or port std
         total_round = math.ceil(len(testing_df) / rebalancing_period)
-        for i in range(total_round):
-            # split data
-            training_df_r, testing_df_r = split_dataframe(
-                dataframe,
-                first_half_period = len(training_df) + rebalancing_period * i,
-            )
-
-            # training / get optimal weights
-            if (slicing):
-                training_df_r = training_df_r[rebalancing_period * i:]
-            testing_interval_df_r = testing_df_r[:rebalancing_period]
-
-            training_df_r = training_df_r.dropna(axis=1)
-            testing_interval_df_r = testing_interval_df_r.dropna(axis=1)
-            if training_df_r.empty or testing_interval_df_r.empty \
-               or len(training_df_r.columns) < 2 \
-               or len(testing_interval_df_r.columns) < 2:
+        round_results = run_walk_forward(
+            dataframe, returns_function, risk_free_rate, len(training_df),
+            rebalancing_period, total_round, slicing, num_workers, **kwargs)
+        for round_result in round_results:
+            if (round_result is None):
                 continue
-            common_columns = np.intersect1d(training_df_r.columns, testing_interval_df_r.columns)
-            # print(common_columns)
-
-            training_df_r = training_df_r[common_columns]
-            testing_interval_df_r = testing_interval_df_r[common_columns]
-            # print(training_df_r)
-            # print(testing_interval_df_r)
-            kwargs['tickers'] = common_columns
-            optimal_weights_r = get_optimal_weights(
-                training_df_r, returns_function, risk_free_rate, **kwargs
-            )
-            buy_date = training_df_r.index[-1:].format()[0]
-            print(get_allocation(common_columns, optimal_weights_r, buy_date))
+            allocation, port_returns_r, port_std_r, port_interval_r, _ = \
+                round_result
+            print(allocation)
             print('')
 
-
-            # testing / get port returns, port std
-            port_interval_r = len(testing_interval_df_r)
-            testing_daily_returns_r = testing_interval_df_r.pct_change()
-            testing_mean_returns_r = testing_daily_returns_r.mean()
-            testing_cov_matrix_r = testing_daily_returns_r.cov()
-
-            port_returns_r = portfolio_return(
-                optimal_weights_r, testing_mean_returns_r, testing_cov_matrix_r)
-            port_std_r = portfolio_standard_deviation(
-                optimal_weights_r, testing_mean_returns_r, testing_cov_matrix_r)
-
             # append result
             port_returns_result.append(port_returns_r)
             port_std_result.append(port_std_r)
@@ -0,0 +1,55 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from .covariance import (
+    FactorCovariance
+)
+
+WindowStatistics = namedtuple(
+    'WindowStatistics', ['daily_returns', 'mean_returns', 'cov_matrix'])
+
+def get_window_start_date(years, now=None):
+    now = now or datetime.now()
+    return pd.Timestamp((now - timedelta(days=365*years)).date())
+
+def compute_window_statistics(dataframe, start_date):
+    """
+    - daily returns, mean returns and covariance of every column, using
+      only rows after start_date
+    """
+    window = dataframe.loc[dataframe.index > start_date]
+    daily_returns = window.pct_change()
+    return WindowStatistics(
+        daily_returns, daily_returns.mean(), daily_returns.cov())
+
+def compute_rolling_window_statistics(dataframe, years_list, now=None):
+    """
+    - {years: WindowStatistics} for the last `years` years of dataframe
+    """
+    statistics = {}
+    for years in years_list:
+        statistics[years] = compute_window_statistics(
+            dataframe, get_window_start_date(years, now))
+    return statistics
+
+def select_tickers(statistics, tickers):
+    """
+    - statistics of a subset of tickers, taken from the precomputed full
+      statistics by position instead of recomputing them
+    """
+    positions = statistics.mean_returns.index.get_indexer(tickers)
+    if ((positions < 0).any()):
+        missing = [ticker for ticker, position in zip(tickers, positions)
+                   if position < 0]
+        raise KeyError('{0} not in index'.format(missing))
+    if (isinstance(statistics.cov_matrix, FactorCovariance)):
+        cov_matrix = statistics.cov_matrix.take(positions)
+    else:
+        cov_matrix = statistics.cov_matrix.iloc[positions, positions]
+    return WindowStatistics(
+        statistics.daily_returns.iloc[:, positions],
+        statistics.mean_returns.iloc[positions],
+        cov_matrix
+    )
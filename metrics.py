@@ -0,0 +1,196 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds, from a cached response to a cold 94-asset request
+TIME_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.,
+                2.5, 5., 10., 30.)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if (not pairs):
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('"', '\\"'))
+                             for name, value in pairs)
+
+def _format_value(value):
+    if (value == float('inf')):
+        return '+Inf'
+    return repr(float(value))
+
+class Counter:
+    """
+    - monotonically increasing count per label values
+        requests = Counter('requests_total', 'Requests.', ['endpoint'])
+        requests.inc('/get_optimal_portfolio')
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        return ['%s%s %s' % (self.name,
+                             _format_labels(self.labelnames, labelvalues),
+                             _format_value(value))
+                for labelvalues, value in sorted(values.items())]
+
+class Histogram:
+    """
+    - cumulative bucket counts, sum and count per label values
+        seconds = Histogram('stage_seconds', 'Stage time.', ['stage'])
+        seconds.observe(0.12, 'anchor_points')
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            counts, total = self._values.get(
+                labelvalues, ([0] * (len(self.buckets) + 1), 0.))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[labelvalues] = (counts, total + value)
+
+    def collect(self):
+        with self._lock:
+            values = {key: (list(counts), total)
+                      for key, (counts, total) in self._values.items()}
+        lines = []
+        for labelvalues, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (self.name,
+                    _format_labels(self.labelnames, labelvalues,
+                                   [('le', _format_value(bound))]),
+                    cumulative))
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append('%s_sum%s %s' % (self.name, labels, _format_value(total)))
+            lines.append('%s_count%s %d' % (self.name, labels, cumulative))
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        - all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+request_count = registry.register(Counter(
+    'portfolio_requests_total', 'HTTP requests by endpoint and status.',
+    ['endpoint', 'status']))
+request_seconds = registry.register(Histogram(
+    'portfolio_request_seconds', 'HTTP request latency by endpoint.',
+    ['endpoint']))
+stage_seconds = registry.register(Histogram(
+    'portfolio_stage_seconds', 'Time spent in each stage of a request.',
+    ['stage']))
+solver_iterations = registry.register(Histogram(
+    'portfolio_solver_iterations', 'Solver iterations (OptimizeResult.nit).',
+    ['solve'], buckets=COUNT_BUCKETS))
+solver_evaluations = registry.register(Histogram(
+    'portfolio_solver_function_evaluations',
+    'Solver function evaluations (OptimizeResult.nfev).',
+    ['solve'], buckets=COUNT_BUCKETS))
+
+# observations of the current request, or of the current pool job
+_local = threading.local()
+
+def start_recording():
+    _local.observations = []
+
+def stop_recording():
+    observations = getattr(_local, 'observations', None)
+    _local.observations = None
+    return observations or []
+
+def _record(kind, value, label):
+    if (kind == 'stage'):
+        stage_seconds.observe(value, label)
+    elif (kind == 'nit'):
+        solver_iterations.observe(value, label)
+    elif (kind == 'nfev'):
+        solver_evaluations.observe(value, label)
+    observations = getattr(_local, 'observations', None)
+    if (observations is not None):
+        observations.append((kind, value, label))
+
+def replay(observations):
+    """
+    - record observations returned by collect() in another process
+    """
+    for kind, value, label in observations:
+        _record(kind, value, label)
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record('stage', time.perf_counter() - start, stage)
+
+def record_solver(solve, result):
+    """
+    - nit and nfev of a scipy OptimizeResult, if the solver reports them
+    """
+    if (result.get('nit') is not None):
+        _record('nit', result['nit'], solve)
+    if (result.get('nfev') is not None):
+        _record('nfev', result['nfev'], solve)
+
+def collect(function, *args):
+    """
+    - (function(*args), observations made while it ran), for a pool worker
+      whose metrics would otherwise stay in its own process
+    """
+    start_recording()
+    try:
+        result = function(*args)
+    finally:
+        observations = stop_recording()
+    return result, observations
+
+def server_timing(observations):
+    """
+    - Server-Timing header value, total milliseconds per stage
+    """
+    totals = {}
+    for kind, value, label in observations:
+        if (kind == 'stage'):
+            totals[label] = totals.get(label, 0.) + value
+    return ', '.join('%s;dur=%.3f' % (stage, seconds * 1000)
+                     for stage, seconds in totals.items())
@@ -9,10 +9,42 @@ from random import randint
 import config
 quandl.ApiConfig.api_key = config.api_key
 
-def get_historical_price(tickers, start_date, end_date):
-    data = quandl.get_table('WIKI/PRICES', ticker=tickers,
+from fetcher import (
+    fetch_batches,
+    split_into_batches
+)
+from functions.critical_line import (
+    critical_line_algorithm,
+    frontier_weights
+)
+from functions.simulation import (
+    evaluate_portfolios,
+    random_weights,
+    simulate_random_portfolios
+)
+from functions.efficient_frontier import (
+    display_random_portfolios,
+    get_highest_simulated_return
+)
+
+def quandl_transport(tickers, start_date, end_date):
+    return quandl.get_table('WIKI/PRICES', ticker=tickers,
         qopts={ 'columns': ['date', 'ticker', 'adj_close'] },
         date={ 'gte': start_date, 'lte': end_date }, paginate=True)
+
+def get_historical_price(tickers, start_date, end_date,
+                         transport=quandl_transport):
+    requests = [(batch, start_date, end_date)
+                for batch in split_into_batches(tickers)]
+    results = fetch_batches(transport, requests)
+    tables = [data for data, _ in results if data is not None]
+    if (not tables):
+        errors = [error for _, error in results if error is not None]
+        last_error = errors[-1] if errors else None
+        raise RuntimeError('every batch failed to download: %s, last error: %r'
+                           % ([batch for batch, _, _ in requests], last_error)) \
+            from last_error
+    data = pd.concat(tables)
     df = data.set_index('date')
     table = df.pivot(columns='ticker')
     table.columns = [col[1] for col in table.columns]
@@ -26,17 +58,10 @@ def portfolio_annualized_performance(weights, mean_returns, cov_matrix):
 
 def random_portfolios(num_portfolios, mean_returns, cov_matrix,
                       risk_free_rate):
-    results = np.zeros((3,num_portfolios))
-    weights_record = []
-    for i in range(num_portfolios):
-        weights = np.random.random(len(mean_returns))
-        weights /= np.sum(weights)
-        weights_record.append(weights)
-        port_return, port_std = portfolio_annualized_performance(
-            weights, mean_returns, cov_matrix)
-        results[0][i] = port_return
-        results[1][i] = port_std
-        results[2][i] = (port_return - risk_free_rate) / port_std
+    weights = random_weights(num_portfolios, len(mean_returns))
+    results = evaluate_portfolios(
+        weights, mean_returns, cov_matrix, risk_free_rate)
+    weights_record = list(weights)
     return results, weights_record
 
 def neg_sharpe_ratio(weights, mean_returns, cov_matrix, risk_free_rate):
@@ -107,8 +132,10 @@ def get_allocation(columns, weight):
     allocation = allocation.T
     return allocation
 
-def efficient_return(mean_returns, cov_matrix, target):
+def efficient_return(mean_returns, cov_matrix, target, initial_weights=None):
     num_tickers = len(mean_returns)
+    if (initial_weights is None):
+        initial_weights = num_tickers*[1./num_tickers]
     args = (mean_returns, cov_matrix)
 
     def portfolio_return(weights):
@@ -127,22 +154,35 @@ def efficient_return(mean_returns, cov_matrix, target):
     )
     bounds = tuple((0,1) for ticker in range(num_tickers))
     result = sco.minimize(portfolio_standard_deviation,
-        num_tickers*[1./num_tickers],
+        initial_weights,
         args=args, method='SLSQP', bounds=bounds, constraints=constraints)
     return result
 
 
-def efficient_frontier(mean_returns, cov_matrix, returns_range):
+def efficient_frontier(mean_returns, cov_matrix, returns_range,
+                       method='SLSQP'):
+    if (method == 'critical_line'):
+        corners = critical_line_algorithm(mean_returns, cov_matrix)
+        return [{'x': weights,
+                 'fun': portfolio_standard_deviation(
+                     weights, mean_returns, cov_matrix)}
+                for weights in frontier_weights(corners, returns_range)]
+    # each target starts from the weights of the previous one
     efficients = []
+    initial_weights = None
     for ret in returns_range:
-        efficients.append(efficient_return(mean_returns, cov_matrix, ret))
+        result = efficient_return(mean_returns, cov_matrix, ret, initial_weights)
+        if (result['success']):
+            initial_weights = result['x']
+        efficients.append(result)
     return efficients
 
 def display_calculated_ef_with_random(columns, mean_returns, cov_matrix,
                                       num_portfolios, risk_free_rate,
-                                      bound_constraints):
-    results, _ = random_portfolios(
-        num_portfolios, mean_returns, cov_matrix, risk_free_rate)
+                                      bound_constraints, num_workers=1):
+    counts, std_edges, return_edges = simulate_random_portfolios(
+        num_portfolios, mean_returns, cov_matrix, risk_free_rate,
+        reduction='histogram', bins=200, num_workers=num_workers)
 
     max_sharpe_weight = max_sharpe_ratio(
         mean_returns, cov_matrix, risk_free_rate)['x']
@@ -191,8 +231,8 @@ def display_calculated_ef_with_random(columns, mean_returns, cov_matrix,
     color_map = matplotlib.colors.LinearSegmentedColormap.from_list(
         '', ['#D1D1D1', '#60D68C', '#394EC4'])
     plt.figure(figsize=(10, 7))
-    plt.scatter(results[1,:], results[0,:], c=results[2,:],
-        cmap=color_map, marker='o', s=10, alpha=0.3)
+    display_random_portfolios(counts, std_edges, return_edges,
+                              risk_free_rate, color_map)
     plt.colorbar()
     plt.scatter(max_sharpe_port_std, max_sharpe_port_return,
         marker='o', color='#C4396C', edgecolors='black', linewidth=3,
@@ -205,8 +245,10 @@ def display_calculated_ef_with_random(columns, mean_returns, cov_matrix,
         marker='o', color='#36A9D6', edgecolors='black', linewidth=3,
         s=225, zorder=2, label='Minimum Standard Deviation')
 
-    target = np.linspace(min_std_port_return, np.max(results[0]), 50)
-    efficient_portfolios = efficient_frontier(mean_returns, cov_matrix, target)
+    target = np.linspace(min_std_port_return,
+        get_highest_simulated_return(counts, return_edges), 50)
+    efficient_portfolios = efficient_frontier(mean_returns, cov_matrix, target,
+                                              method='critical_line')
     plt.plot([p['fun'] for p in efficient_portfolios], target,
         linestyle='-', color='black', linewidth=3, zorder=1,
         label='Efficient Frontier')
@@ -214,8 +256,8 @@ def display_calculated_ef_with_random(columns, mean_returns, cov_matrix,
     plt.xlabel('Annualized Standard Deviation')
     plt.ylabel('Annualized Return')
     plt.legend(labelspacing=1.25, borderpad=1)
-    # plt.xlim([0, np.max(results[1])])
-    # plt.ylim([0, np.max(results[0])])
+    # plt.xlim([0, std_edges[-1]])
+    # plt.ylim([0, return_edges[-1]])
     plt.show()
 
 def get_bound_constraints(ticker_position, bound_constraint_dictionary):
@@ -1,40 +1,361 @@
+import numpy as np
 import pandas as pd
 import fix_yahoo_finance as yf
+import os
+import json
+from datetime import date
 from pathlib import Path
-from hashlib import sha256
-import base64
+from urllib.parse import quote
 import traceback
 import shutil
+import tempfile
 
 from config import (
-    CACHED_DATA_FOLDER
+    PRICE_STORE_FOLDER
+)
+
+from fetcher import (
+    fetch_batches,
+    split_into_batches
 )
 
 yf.pdr_override()
 
-def get_file_name(tickers, start_date, end_date):
-    file_name = (str(tickers) + str(start_date) + str(end_date)).encode()
-    file_name = sha256(file_name).digest()
-    file_name = base64.b64encode(file_name).decode()
-    file_name = file_name.replace('/', '')
-    file_name = file_name.replace('+', '')
-    file_name = file_name.replace('=', '')
-    file_name += '.pkl'
-    return file_name
-
-def get_historical_price_yahoo(tickers, start_date, end_date):
-    # while True:
-        # try:
-    Path(CACHED_DATA_FOLDER).mkdir(parents=True, exist_ok=True)
-    file_name = get_file_name(tickers, start_date, end_date) 
-    file_path = (CACHED_DATA_FOLDER / file_name).resolve()
-    if Path(file_path).is_file():
-        data = pd.read_pickle(file_path)
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+RECORD_DTYPE = np.dtype([('date', 'datetime64[D]')] + \
+    [(field, 'float64') for field in FIELDS])
+
+def get_ticker_file_path(ticker):
+    return (PRICE_STORE_FOLDER / (quote(ticker, safe='') + '.npy')).resolve()
+
+def get_coverage_file_path(ticker):
+    return (PRICE_STORE_FOLDER / (quote(ticker, safe='') + '.json')).resolve()
+
+def read_coverage(ticker):
+    """
+    - sorted, disjoint [(start, end), ...] date ranges already downloaded
+      for ticker, end is exclusive
+    - return None if nothing was downloaded
+    """
+    file_path = get_coverage_file_path(ticker)
+    if not Path(file_path).is_file():
+        return None
+    with open(file_path) as file:
+        coverage = json.load(file)
+    if 'ranges' not in coverage:
+        # single span written by earlier versions
+        coverage = {'ranges': [[coverage['start'], coverage['end']]]}
+    return [(np.datetime64(start, 'D'), np.datetime64(end, 'D'))
+            for start, end in coverage['ranges']]
+
+def replace_file(file_path, write, mode='w'):
+    """
+    - write(file) to a temporary file next to file_path, then move it in
+      place, so readers never see a half-written file
+    - the temporary name is unique, concurrent writers of the same file
+      do not write into each other's temporary file
+    """
+    Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(
+        dir=Path(file_path).parent, prefix=Path(file_path).name + '.',
+        suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, mode) as file:
+            write(file)
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+def write_coverage(ticker, coverage):
+    replace_file(get_coverage_file_path(ticker), lambda file: json.dump(
+        {'ranges': [[str(start), str(end)] for start, end in coverage]},
+        file))
+
+def add_coverage(coverage, start, end):
+    """
+    - coverage with [start, end) added, ranges that overlap or touch are
+      merged, ranges separated by a gap stay apart
+    """
+    merged = []
+    for first, last in sorted((coverage or []) + [(start, end)]):
+        if merged and first <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+def get_missing_ranges(coverage, start, end):
+    """
+    - date ranges [start, end) of the request that are not covered yet
+    """
+    ranges = []
+    for first, last in coverage or []:
+        if first > start:
+            ranges.append((start, min(first, end)))
+        start = max(start, last)
+        if start >= end:
+            break
+    if start < end:
+        ranges.append((start, end))
+    return [(first, last) for first, last in ranges if first < last]
+
+def merge_records(old_records, new_records):
+    """
+    - union of both by date, new_records win on the same date, so merging
+      the same download twice changes nothing
+    """
+    if old_records is None or len(old_records) == 0:
+        records = np.array(new_records, dtype=RECORD_DTYPE)
     else:
-        data = yf.download(tickers, start_date, end_date, auto_adjust=True)
-        # shutil.rmtree(CACHED_DATA_FOLDER)
-        # Path(CACHED_DATA_FOLDER).mkdir(parents=True, exist_ok=True)
-        data.to_pickle(file_path)
-    return data
-        # except ValueError as e:
-        #     print(e)
+        records = np.concatenate([new_records, old_records])
+    _, first = np.unique(records['date'], return_index=True)
+    return records[first]
+
+def read_ticker(ticker):
+    """
+    - stored records of one ticker sorted by date, memory-mapped read-only
+    - return None if the ticker is not stored
+    """
+    file_path = get_ticker_file_path(ticker)
+    if not Path(file_path).is_file():
+        return None
+    return np.load(file_path, mmap_mode='r')
+
+def write_ticker(ticker, records):
+    replace_file(get_ticker_file_path(ticker),
+                 lambda file: np.save(file, records), 'wb')
+
+def dataframe_to_records(dataframe):
+    """
+    - dataframe = yf.download output of a single ticker, columns FIELDS
+    """
+    dataframe = dataframe.dropna(how='all')
+    records = np.zeros(len(dataframe), dtype=RECORD_DTYPE)
+    records['date'] = dataframe.index.values.astype('datetime64[D]')
+    for field in FIELDS:
+        if field in dataframe.columns:
+            records[field] = dataframe[field].values
+        else:
+            records[field] = np.nan
+    return records
+
+def split_download(data, tickers):
+    """
+    - {ticker: records} from a yf.download of one or many tickers
+    """
+    if not isinstance(data.columns, pd.MultiIndex):
+        return {tickers[0]: dataframe_to_records(data)}
+    result = {}
+    for ticker in tickers:
+        if ticker in data.columns.get_level_values(1):
+            result[ticker] = dataframe_to_records(
+                data.xs(ticker, axis=1, level=1))
+    return result
+
+def assemble_panel(records_by_ticker, tickers, start_date, end_date):
+    """
+    - one dataframe in the yf.download layout, columns (field, ticker),
+      from per-ticker records, restricted to [start_date, end_date]
+    """
+    start = np.datetime64(pd.Timestamp(start_date).date(), 'D') \
+        if start_date is not None else None
+    end = np.datetime64(pd.Timestamp(end_date).date(), 'D') \
+        if end_date is not None else None
+
+    windows = []
+    for ticker in tickers:
+        records = records_by_ticker.get(ticker)
+        if records is None:
+            records = np.zeros(0, dtype=RECORD_DTYPE)
+        first = 0 if start is None else \
+            np.searchsorted(records['date'], start, side='left')
+        # yf.download end_date is exclusive
+        last = len(records) if end is None else \
+            np.searchsorted(records['date'], end, side='left')
+        windows.append(records[first:last])
+
+    dates = np.unique(np.concatenate(
+        [window['date'] for window in windows])) if windows \
+        else np.zeros(0, dtype='datetime64[D]')
+    positions = [np.searchsorted(dates, window['date']) for window in windows]
+    columns = []
+    values = np.full((len(dates), len(FIELDS) * len(tickers)), np.nan)
+    for field_index, field in enumerate(FIELDS):
+        for ticker_index, ticker in enumerate(tickers):
+            column = field_index * len(tickers) + ticker_index
+            values[positions[ticker_index], column] = \
+                windows[ticker_index][field]
+            columns.append((field, ticker))
+    return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='Date'),
+                        columns=pd.MultiIndex.from_tuples(columns))
+
+def to_date(value):
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+def remove_ticker(ticker):
+    """
+    - forget the stored records and coverage of ticker
+    """
+    for file_path in (get_ticker_file_path(ticker),
+                      get_coverage_file_path(ticker)):
+        if Path(file_path).is_file():
+            os.unlink(file_path)
+
+def is_covered(dates, coverage):
+    covered = np.zeros(len(dates), dtype=bool)
+    for first, last in coverage or []:
+        covered |= (dates >= first) & (dates < last)
+    return covered
+
+def get_check_range(records, coverage, first, last):
+    """
+    - [first, last) widened to the nearest covered stored bar on each
+      side; downloading those bars again shows whether the stored prices
+      were adjusted for the same splits and dividends as the new ones
+    """
+    if records is None:
+        return first, last
+    dates = records['date'][is_covered(records['date'], coverage)]
+    before = dates[dates < first]
+    after = dates[dates >= last]
+    if len(before):
+        first = before[-1]
+    if len(after):
+        last = after[0] + np.timedelta64(1, 'D')
+    return first, last
+
+def is_adjusted_alike(old_records, new_records, coverage):
+    """
+    - True if the covered bars of old_records that new_records also has
+      have the same close, yahoo adjusts the whole history for every
+      split and dividend, so bars downloaded at different times only
+      match if no split or dividend happened in between
+    - bars outside the coverage, e.g. today's bar, are not final yet
+    """
+    if old_records is None or len(old_records) == 0:
+        return True
+    old_records = old_records[is_covered(old_records['date'], coverage)]
+    _, old_index, new_index = np.intersect1d(
+        old_records['date'], new_records['date'], return_indices=True)
+    return np.allclose(old_records['Close'][old_index],
+                       new_records['Close'][new_index],
+                       rtol=1e-6, equal_nan=True)
+
+def has_prices(records, start, end):
+    if records is None:
+        return False
+    dates = records['date']
+    return bool(np.any(~np.isnan(
+        records['Close'][(dates >= start) & (dates < end)])))
+
+def get_download_requests(ranges_by_ticker):
+    """
+    - [(batch of tickers, first, last), ...], tickers missing the same
+      range are downloaded together
+    """
+    tickers_by_range = {}
+    for ticker, ranges in ranges_by_ticker.items():
+        for missing_range in ranges:
+            tickers_by_range.setdefault(missing_range, []).append(ticker)
+    requests = []
+    for (first, last), range_tickers in tickers_by_range.items():
+        for batch in split_into_batches(range_tickers):
+            requests.append((batch, str(first), str(last)))
+    return requests
+
+def yahoo_transport(tickers, start_date, end_date):
+    return yf.download(tickers, start_date, end_date, auto_adjust=True)
+
+def get_historical_price_yahoo(tickers, start_date, end_date, download=None):
+    """
+    - download = function(tickers, start_date, end_date) returning a frame
+      in the yf.download layout, e.g. a local stand-in for tests
+    - only the date ranges not stored yet are downloaded, tickers missing
+      the same range are downloaded together in concurrent batches
+    - every download also fetches the stored bar next to each range again;
+      prices are adjusted as of the day they are downloaded, so when that
+      bar changed (a split or dividend since the last download) the
+      stored history is dropped and the whole range is downloaded again
+    - tickers whose batch still fails after retrying, that are missing
+      from the download, or that have no price in the range (e.g. an
+      unknown symbol, which yahoo returns as an empty column) are left
+      out of the coverage, so the next call downloads them again
+    """
+    download = download or yahoo_transport
+    today = np.datetime64(date.today(), 'D')
+    start = to_date(start_date)
+    # today's price is not final yet, it is downloaded but not covered
+    end = min(to_date(end_date), today) if end_date is not None else today
+    download_end = to_date(end_date) if end_date is not None \
+        else today + np.timedelta64(1, 'D')
+
+    ranges_by_ticker = {}
+    check_ranges_by_ticker = {}
+    coverage_by_ticker = {}
+    for ticker in tickers:
+        coverage = read_coverage(ticker)
+        ranges = get_missing_ranges(coverage, start, end)
+        if end_date is None:
+            if ranges and ranges[-1][1] == end:
+                ranges[-1] = (ranges[-1][0], download_end)
+            else:
+                ranges.append((max(end, start), download_end))
+        records = read_ticker(ticker)
+        ranges_by_ticker[ticker] = tuple(ranges)
+        check_ranges_by_ticker[ticker] = tuple(
+            get_check_range(records, coverage, first, last)
+            for first, last in ranges)
+        coverage_by_ticker[ticker] = coverage
+
+    failed_tickers = set()
+    reload_tickers = set()
+    requests = get_download_requests(check_ranges_by_ticker)
+    for (batch, _, _), (data, error) in zip(
+            requests, fetch_batches(download, requests)):
+        if (error is not None):
+            failed_tickers.update(batch)
+            continue
+        records_by_ticker = split_download(data, batch)
+        for ticker in batch:
+            if ticker in reload_tickers:
+                continue
+            records = records_by_ticker.get(ticker)
+            if records is None:
+                failed_tickers.add(ticker)
+                continue
+            old_records = read_ticker(ticker)
+            if not is_adjusted_alike(old_records, records,
+                                     coverage_by_ticker[ticker]):
+                reload_tickers.add(ticker)
+                continue
+            write_ticker(ticker, merge_records(old_records, records))
+
+    # stored bars adjusted differently from today's download
+    for ticker in reload_tickers:
+        remove_ticker(ticker)
+        failed_tickers.discard(ticker)
+    requests = get_download_requests(
+        {ticker: ((start, download_end),) for ticker in reload_tickers})
+    for (batch, _, _), (data, error) in zip(
+            requests, fetch_batches(download, requests)):
+        if (error is not None):
+            failed_tickers.update(batch)
+            continue
+        records_by_ticker = split_download(data, batch)
+        for ticker in batch:
+            if ticker in records_by_ticker:
+                write_ticker(ticker,
+                             merge_records(None, records_by_ticker[ticker]))
+            else:
+                failed_tickers.add(ticker)
+
+    records_by_ticker = {}
+    for ticker in tickers:
+        records = read_ticker(ticker)
+        if ranges_by_ticker[ticker] and end > start \
+           and ticker not in failed_tickers and has_prices(records, start, end):
+            write_coverage(ticker, add_coverage(read_coverage(ticker), start, end))
+        if records is not None:
+            records_by_ticker[ticker] = records
+    return assemble_panel(records_by_ticker, tickers, start_date, end_date)
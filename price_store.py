@@ -0,0 +1,88 @@
+import threading
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from config import (
+    PRICE_REFRESH_TIME
+)
+
+PriceSnapshot = namedtuple('PriceSnapshot', ['data', 'version', 'loaded_at'])
+
+def get_next_refresh_time(now=None, refresh_time=PRICE_REFRESH_TIME):
+    """
+    - refresh_time = (hour, minute) in UTC, e.g. after the market close
+    """
+    now = now or datetime.utcnow()
+    next_refresh = now.replace(hour=refresh_time[0], minute=refresh_time[1],
+                               second=0, microsecond=0)
+    if (next_refresh <= now):
+        next_refresh += timedelta(days=1)
+    return next_refresh
+
+class PriceStore:
+    """
+    - in-process, read-only copy of the cleaned price data
+    - loader() returns the data, it is called once on first use and then
+      again every day at refresh_time by a background thread
+    - a refresh builds a whole new snapshot and swaps it in with one
+      assignment, so readers always see either the old or the new data;
+      callers must not modify what they get
+    """
+    def __init__(self, loader, refresh_time=PRICE_REFRESH_TIME):
+        self._loader = loader
+        self._refresh_time = refresh_time
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self):
+        snapshot = self._snapshot
+        if (snapshot is None):
+            with self._lock:
+                if (self._snapshot is None):
+                    self._snapshot = self._load()
+                    self._start()
+                snapshot = self._snapshot
+        return snapshot
+
+    def set(self, snapshot):
+        """
+        - serve snapshot from now on, without loading or refreshing, e.g.
+          in a worker process that got it from the process that loaded it
+        """
+        self._snapshot = snapshot
+
+    def refresh(self):
+        snapshot = self._load()
+        self._snapshot = snapshot
+        return snapshot
+
+    def next_refresh_time(self):
+        return get_next_refresh_time(refresh_time=self._refresh_time)
+
+    def stop(self):
+        self._stop.set()
+
+    def _load(self):
+        loaded_at = datetime.utcnow()
+        data = self._loader()
+        version = loaded_at.strftime('%Y%m%d%H%M%S%f')
+        return PriceSnapshot(data, version, loaded_at)
+
+    def _start(self):
+        if (self._thread is None):
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            wait = (self.next_refresh_time() - datetime.utcnow()).total_seconds()
+            if (self._stop.wait(max(wait, 0))):
+                return
+            try:
+                self.refresh()
+            except Exception:
+                # keep serving the old snapshot until the next refresh
+                traceback.print_exc()
@@ -0,0 +1,106 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from config import (
+    SERVING_MAX_PENDING,
+    SERVING_TIMEOUT,
+    SERVING_WORKERS
+)
+
+class PoolBusy(Exception):
+    """
+    - raised instead of queueing when max_pending jobs are already running
+      or waiting, or when a worker died, the client should retry later
+    """
+
+class DeadlineExceeded(Exception):
+    """
+    - raised when a job has no result within its deadline
+    """
+
+def _warm_up():
+    pass
+
+class OptimizationPool:
+    """
+    - runs CPU-heavy jobs on a pool of worker processes, so request
+      threads only wait on them and one slow job cannot block the others
+    - workers start from a fresh interpreter (forkserver where the
+      platform has it, else spawn) rather than a fork of the caller: the
+      caller is usually a request thread of a multi-threaded server, and a
+      fork would copy locks other threads hold at that moment (metrics,
+      logging, caches) into the child, held forever
+    - initializer(*initargs) runs once in every worker when it starts,
+      e.g. to hand it the price data the caller already loaded, and all
+      workers are started up front
+    - at most max_pending jobs are running or queued, further jobs are
+      rejected with PoolBusy (load shedding)
+    - run() waits at most timeout seconds and then raises
+      DeadlineExceeded; a job that already started keeps its worker and
+      its pending slot until it finishes, since a process cannot be
+      interrupted safely
+    - when a worker process dies the pool is broken: the jobs fail with
+      PoolBusy and broken is set, so the owner can replace the pool
+    """
+    def __init__(self, initializer=None, initargs=(),
+                 max_workers=SERVING_WORKERS, max_pending=SERVING_MAX_PENDING,
+                 timeout=SERVING_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.broken = False
+        self._lock = threading.Lock()
+        context = multiprocessing.get_context('forkserver') \
+            if 'forkserver' in multiprocessing.get_all_start_methods() \
+            else multiprocessing.get_context('spawn')
+        self._executor = ProcessPoolExecutor(max_workers=max_workers,
+            mp_context=context, initializer=initializer, initargs=initargs)
+        # start every worker now instead of on the first requests
+        for future in [self._executor.submit(_warm_up)
+                       for _ in range(max_workers)]:
+            future.result()
+
+    def submit(self, function, *args, **kwargs):
+        with self._lock:
+            if (self.pending >= self.max_pending):
+                raise PoolBusy('%d optimization jobs are pending, try again later'
+                               % self.pending)
+            self.pending += 1
+        try:
+            future = self._executor.submit(function, *args, **kwargs)
+        except BrokenProcessPool:
+            self._release()
+            self.broken = True
+            raise PoolBusy('a worker process died, try again later')
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def run(self, function, *args, timeout=None, **kwargs):
+        """
+        - function(*args, **kwargs) on a worker; function and its arguments
+          must be picklable, e.g. module-level functions
+        """
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(function, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except BrokenProcessPool:
+            self.broken = True
+            raise PoolBusy('a worker process died, try again later')
+        except TimeoutError:
+            # frees the slot at once if the job has not started yet
+            future.cancel()
+            raise DeadlineExceeded('no result within %g seconds' % timeout)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
@@ -1 +1 @@
-pipenv run gunicorn -w 4 --thread 8 -b 0.0.0.0:60001 --chdir /home/ubuntu/givemebestportfolio-backend/ api:app
\ No newline at end of file
+SERVING_MODE=pool pipenv run gunicorn -w 1 --thread 32 -b 0.0.0.0:60001 --chdir /home/ubuntu/givemebestportfolio-backend/ api:app
\ No newline at end of file
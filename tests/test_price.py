@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fetcher
+import price
+
+class FakeYahoo:
+    """
+    - stand-in for yf.download, close = factor * (100 + business day number)
+    - unknown tickers come back as empty columns, like yahoo does
+    """
+    def __init__(self, unknown=()):
+        self.unknown = set(unknown)
+        self.factors = {}
+        self.calls = []
+
+    def __call__(self, tickers, start_date, end_date):
+        self.calls.append((tuple(tickers), start_date, end_date))
+        dates = pd.bdate_range(start_date, pd.Timestamp(end_date)
+                               - pd.Timedelta(days=1), name='Date')
+        days = np.asarray((dates - pd.Timestamp('2000-01-03')).days, dtype=float)
+        columns = pd.MultiIndex.from_product([price.FIELDS, tickers])
+        values = np.full((len(dates), len(columns)), np.nan)
+        for field_index in range(len(price.FIELDS)):
+            for ticker_index, ticker in enumerate(tickers):
+                if ticker not in self.unknown:
+                    values[:, field_index * len(tickers) + ticker_index] = \
+                        self.factors.get(ticker, 1.) * (100 + days)
+        return pd.DataFrame(values, index=dates, columns=columns)
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(price, 'PRICE_STORE_FOLDER', tmp_path)
+    monkeypatch.setattr(fetcher.rate_limiter, 'rate', 1e6)
+
+def get(download, tickers, start_date, end_date):
+    return price.get_historical_price_yahoo(tickers, start_date, end_date,
+                                            download=download)
+
+def test_downloads_only_missing_ranges(store):
+    download = FakeYahoo()
+    get(download, ['A', 'B'], '2015-01-01', '2016-01-01')
+    assert len(download.calls) == 1
+
+    get(download, ['A', 'B'], '2015-03-01', '2015-09-01')
+    assert len(download.calls) == 1
+
+    panel = get(download, ['A', 'B'], '2015-01-01', '2016-06-01')
+    assert len(download.calls) == 2
+    # the last stored bar is downloaded again to compare it
+    assert download.calls[-1][1:] == ('2015-12-31', '2016-06-01')
+    assert price.read_coverage('A') == [(np.datetime64('2015-01-01'),
+                                         np.datetime64('2016-06-01'))]
+    assert not panel['Close'].isnull().values.any()
+
+def test_unknown_ticker_is_downloaded_again(store):
+    download = FakeYahoo(unknown=['BAD'])
+    panel = get(download, ['A', 'BAD'], '2015-01-01', '2016-01-01')
+    assert price.read_coverage('A') is not None
+    assert price.read_coverage('BAD') is None
+    assert panel['Close']['BAD'].isnull().all()
+
+    download.unknown.clear()
+    panel = get(download, ['A', 'BAD'], '2015-01-01', '2016-01-01')
+    assert download.calls[-1][0] == ('BAD',)
+    assert not panel['Close']['BAD'].isnull().any()
+
+def test_split_downloads_history_again(store):
+    download = FakeYahoo()
+    get(download, ['A', 'B'], '2015-01-01', '2016-01-01')
+
+    # a 10:1 split of A adjusts its whole history
+    download.factors['A'] = 0.1
+    panel = get(download, ['A', 'B'], '2015-01-01', '2016-06-01')
+    assert download.calls[-1] == (('A',), '2015-01-01', '2016-06-01')
+    close = panel['Close']
+    np.testing.assert_allclose(close['A'], close['B'] * 0.1)
+    assert price.read_coverage('A') == [(np.datetime64('2015-01-01'),
+                                         np.datetime64('2016-06-01'))]